@@ -1,6 +1,7 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for, make_response
 from flask_cors import CORS
 import config
+import atexit
 import os
 
 app = Flask(__name__)
@@ -15,20 +16,40 @@ os.makedirs(config.UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(os.path.dirname(config.DATABASE_PATH), exist_ok=True)
 
 # 初始化数据库
-from database import DatabaseManager
-db = DatabaseManager()
+from database.db_manager import db
 
 # 导入路由
-from routes import auth, space, file
+from routes import auth, space, file, upload, event, metrics
 
 # 注册蓝图
 app.register_blueprint(auth.bp)
 app.register_blueprint(space.bp)
 app.register_blueprint(file.bp)
+app.register_blueprint(upload.bp)
+app.register_blueprint(event.bp)
+app.register_blueprint(metrics.bp)
+
+# 按Accept-Encoding压缩JSON和文本响应
+from utils.compression import compress_response
+app.after_request(compress_response)
+
+
+@app.before_request
+def block_static_uploads():
+    """旧版本的上传目录位于static/uploads，禁止通过静态路由访问其中的文件（只能经权限校验的接口下载）"""
+    if request.path.startswith(app.static_url_path + '/uploads/'):
+        return jsonify({'success': False, 'message': '页面不存在'}), 404
+
 
 # 启动清理服务
+# 清理任务由数据库租约选出唯一执行的进程；开发服务器的重载监控进程不启动
 from services.cleanup_service import CleanupService
 cleanup_service = CleanupService()
+if config.SCHEDULER_ENABLED and not (__name__ == '__main__' and not os.environ.get('WERKZEUG_RUN_MAIN')):
+    cleanup_service.start()
+
+# 退出时关闭连接池中的数据库连接
+atexit.register(db.close_all)
 
 
 @app.route('/')
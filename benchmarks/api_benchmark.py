@@ -0,0 +1,386 @@
+"""
+HTTP 接口基准测试
+
+在临时目录（独立的数据库和上传目录）中启动一个本地实例，写入指定规模的数据，
+再用多个并发客户端依次压测热点流程，按接口输出吞吐量和 p50/p95/p99 延迟（JSON）：
+
+    python benchmarks/api_benchmark.py --spaces 500 --files 300 --clients 8 --output result.json
+    python benchmarks/api_benchmark.py --compare baseline.json --output result.json
+
+也可以通过 --url 压测已经运行的实例（数据写入该实例的数据库）。
+"""
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlsplit
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def parse_size(value):
+    """解析大小，如 1KB、256KB、4MB"""
+    value = value.strip().upper()
+    for suffix, factor in (('KB', 1024), ('MB', 1024 * 1024), ('B', 1)):
+        if value.endswith(suffix):
+            return int(float(value[:-len(suffix)]) * factor)
+    return int(value)
+
+
+def percentile(sorted_values, p):
+    """最近秩法百分位"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Client:
+    """单个客户端（保持长连接，自行维护Cookie）"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.cookie = None
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        """发送请求，返回(状态码, 响应体)"""
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # 服务端关闭了空闲连接，重连一次
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie and set_cookie.startswith('auth_token='):
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response.status, data
+
+    def json(self, method, path, body=None):
+        status, data = self.request(method, path, body)
+        return status, json.loads(data) if data else None
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+
+
+class Recorder:
+    """按接口记录延迟和错误"""
+
+    def __init__(self):
+        self.results = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, ok):
+        with self._lock:
+            item = self.results.setdefault(name, {'latencies': [], 'errors': 0, 'elapsed': 0.0})
+            item['latencies'].append(seconds)
+            if not ok:
+                item['errors'] += 1
+
+    def set_elapsed(self, name, seconds):
+        with self._lock:
+            self.results.setdefault(name, {'latencies': [], 'errors': 0, 'elapsed': 0.0})['elapsed'] = seconds
+
+    def summary(self):
+        report = {}
+        for name, item in self.results.items():
+            latencies = sorted(item['latencies'])
+            count = len(latencies)
+            report[name] = {
+                'requests': count,
+                'errors': item['errors'],
+                'throughput_rps': round(count / item['elapsed'], 2) if item['elapsed'] else None,
+                'mean_ms': round(sum(latencies) / count * 1000, 3) if count else None,
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3) if count else None,
+                'p95_ms': round(percentile(latencies, 95) * 1000, 3) if count else None,
+                'p99_ms': round(percentile(latencies, 99) * 1000, 3) if count else None,
+                'max_ms': round(latencies[-1] * 1000, 3) if count else None,
+            }
+        return report
+
+
+def log(message):
+    """进度信息输出到标准错误，标准输出只保留结果JSON"""
+    print(f"[基准测试] {message}", file=sys.stderr)
+
+
+def run_phase(recorder, name, clients, requests_per_client, action):
+    """并发执行一个阶段：每个客户端线程执行action(client, i)若干次"""
+    barrier = threading.Barrier(len(clients) + 1)
+
+    def worker(client):
+        barrier.wait()
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            try:
+                ok = action(client, i)
+            except Exception:
+                ok = False
+            recorder.record(name, time.perf_counter() - start, ok)
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    recorder.set_elapsed(name, time.perf_counter() - start)
+    log(f"{name} 完成")
+
+
+def seed(client, args, password):
+    """写入测试数据：N个空间（其中一个为目标空间）和目标空间内M个文本"""
+    run_id = uuid.uuid4().hex[:8]
+    for i in range(args.spaces):
+        client.json('POST', '/api/spaces', {'name': f'bench-{run_id}-{i}', 'password': f'bench-{run_id}-{i}'})
+
+    status, result = client.json('POST', '/api/spaces', {'name': f'bench-{run_id}-target', 'password': password})
+    if status != 200 or not result.get('success'):
+        raise RuntimeError(f"创建目标空间失败: {result}")
+    space_id = result['space_id']
+
+    for i in range(args.files):
+        client.json('POST', f'/api/spaces/{space_id}/files', {'type': 'text', 'content': f'benchmark text {i}\n' * 20})
+    return space_id
+
+
+def run_benchmark(base_url, args):
+    """执行全部阶段，返回各接口统计"""
+    recorder = Recorder()
+    password = f'bench-target-{uuid.uuid4().hex[:8]}'
+
+    admin = Client(base_url)
+    admin.json('POST', '/api/auth/login', {'password': args.password})
+    log(f"写入数据：{args.spaces} 个空间，目标空间 {args.files} 个文件")
+    space_id = seed(admin, args, password)
+
+    clients = [Client(base_url) for _ in range(args.clients)]
+    n = args.requests
+
+    def login(client, i):
+        status, result = client.json('POST', '/api/auth/login', {'password': args.password})
+        return status == 200 and result['success']
+
+    def list_spaces(client, i):
+        return client.request('GET', '/api/spaces')[0] == 200
+
+    def enter_space(client, i):
+        status, result = client.json('POST', '/api/spaces/enter', {'password': password})
+        return status == 200 and result['success']
+
+    def list_files(client, i):
+        return client.request('GET', f'/api/spaces/{space_id}/files')[0] == 200
+
+    run_phase(recorder, 'login', clients, n, login)
+    run_phase(recorder, 'enter_space', clients, n, enter_space)
+
+    # 之后的阶段使用写入数据时的令牌，空间列表包含全部已访问的空间（受访问记录上限限制）
+    for client in clients:
+        client.cookie = admin.cookie
+    run_phase(recorder, 'list_spaces', clients, n, list_spaces)
+    run_phase(recorder, 'list_files', clients, n, list_files)
+
+    for size in args.sizes:
+        label = args.size_labels[size]
+        payload = os.urandom(size)
+        uploaded = []
+        uploaded_lock = threading.Lock()
+
+        def upload(client, i, payload=payload, uploaded=uploaded, uploaded_lock=uploaded_lock):
+            # 每次上传内容不同，避免命中内容去重
+            body = uuid.uuid4().bytes + payload[16:]
+            status, data = client.request('POST', f'/api/spaces/{space_id}/files/stream?filename=bench.bin',
+                                          body=body, headers={'Content-Type': 'application/octet-stream'})
+            if status != 200:
+                return False
+            with uploaded_lock:
+                uploaded.append(json.loads(data)['file_id'])
+            return True
+
+        def download(client, i, uploaded=uploaded, size=size):
+            file_id = uploaded[i % len(uploaded)]
+            status, data = client.request('GET', f'/api/files/{file_id}/download')
+            return status == 200 and len(data) == size
+
+        upload_requests = max(1, min(n, args.max_upload_bytes // max(size * len(clients), 1)))
+        run_phase(recorder, f'upload_{label}', clients, upload_requests, upload)
+        if uploaded:
+            run_phase(recorder, f'download_{label}', clients, n, download)
+
+    for client in clients + [admin]:
+        client.close()
+
+    return recorder.summary()
+
+
+def compare(report, baseline, threshold):
+    """与基准结果比较，返回退化的接口列表"""
+    regressions = []
+    print(f"\n{'接口':<24}{'p95(基准)':>12}{'p95(本次)':>12}{'吞吐(基准)':>12}{'吞吐(本次)':>12}", file=sys.stderr)
+    for name, current in report['endpoints'].items():
+        base = baseline.get('endpoints', {}).get(name)
+        if not base or not base.get('p95_ms') or not current.get('p95_ms'):
+            continue
+        print(f"{name:<24}{base['p95_ms']:>12}{current['p95_ms']:>12}"
+              f"{base['throughput_rps'] or 0:>12}{current['throughput_rps'] or 0:>12}", file=sys.stderr)
+        if current['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append(name)
+    return regressions
+
+
+def serve(port, data_dir):
+    """在子进程中启动本地实例（使用临时数据库和上传目录，不运行定时清理）"""
+    import config
+    config.DATABASE_PATH = os.path.join(data_dir, 'data', 'sharezone.db')
+    config.UPLOAD_FOLDER = os.path.join(data_dir, 'uploads')
+    config.BLOB_FOLDER = os.path.join(config.UPLOAD_FOLDER, 'blobs')
+    config.UPLOAD_PARTS_FOLDER = config.UPLOAD_FOLDER + '_parts'
+    config.SCHEDULER_ENABLED = False
+
+    from werkzeug.serving import make_server
+    from app import app
+    # 不输出每个请求的访问日志
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def start_local_instance(data_dir):
+    """启动本地实例，返回(进程, 地址)"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', str(port), '--data-dir', data_dir],
+        stdout=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, base_url
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError('本地实例启动失败')
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('本地实例启动超时')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP 接口基准测试')
+    parser.add_argument('--url', help='压测已运行的实例（默认在临时目录中启动本地实例）')
+    parser.add_argument('--password', help='系统密码（默认使用config.py中的配置）')
+    parser.add_argument('--spaces', type=int, default=200, help='预先创建的空间数')
+    parser.add_argument('--files', type=int, default=200, help='目标空间内预先创建的文件数')
+    parser.add_argument('--clients', type=int, default=8, help='并发客户端数')
+    parser.add_argument('--requests', type=int, default=50, help='每个客户端在每个阶段的请求数')
+    parser.add_argument('--sizes', default='1KB,256KB,4MB', help='上传/下载的文件大小，逗号分隔')
+    parser.add_argument('--max-upload-bytes', type=parse_size, default=parse_size('512MB'),
+                        help='每种大小上传的总字节数上限（大文件会相应减少上传次数）')
+    parser.add_argument('--output', help='结果JSON文件（默认输出到标准输出）')
+    parser.add_argument('--compare', help='基准结果JSON文件，p95延迟超过阈值时以非零状态退出')
+    parser.add_argument('--threshold', type=float, default=0.2, help='允许的p95延迟退化比例')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.data_dir)
+        return
+
+    if not args.password:
+        import config
+        args.password = config.SYSTEM_PASSWORD
+
+    labels = [label.strip() for label in args.sizes.split(',') if label.strip()]
+    args.sizes = [parse_size(label) for label in labels]
+    args.size_labels = dict(zip(args.sizes, [label.lower() for label in labels]))
+
+    process = None
+    data_dir = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            data_dir = tempfile.mkdtemp(prefix='sharezone-bench-')
+            process, base_url = start_local_instance(data_dir)
+
+        started_at = datetime.now().isoformat(timespec='seconds')
+        endpoints = run_benchmark(base_url, args)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    report = {
+        'started_at': started_at,
+        'target': args.url or 'local',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {
+            'spaces': args.spaces,
+            'files': args.files,
+            'clients': args.clients,
+            'requests': args.requests,
+            'sizes': labels,
+        },
+        'endpoints': endpoints,
+    }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        log(f"结果已写入 {args.output}")
+    else:
+        print(output)
+
+    if data_dir:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            log(f"以下接口 p95 延迟退化超过 {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+多进程部署的定时清理租约检查
+
+在临时目录（独立的数据库和上传目录）中用 gunicorn.conf.py 启动多个工作进程，检查：
+    1. 所有进程都运行调度器，但只有一个进程持有 cleanup 租约，且持有者保持稳定；
+    2. 持有者被强制结束（SIGKILL，模拟崩溃）后，租约过期并由另一个进程接替；
+    3. 持有者正常退出（SIGTERM，如平滑重启）时主动释放租约，其他进程在一个续约间隔内接替。
+
+    python benchmarks/lease_failover_check.py --workers 3
+
+为缩短等待时间，检查时使用较短的租约有效期和续约间隔（--ttl、--renew）。任一检查失败时以非零状态退出。
+"""
+import argparse
+import os
+import re
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# 传递给工作进程的环境变量
+DATA_DIR_ENV = 'SHAREZONE_CHECK_DATA_DIR'
+TTL_ENV = 'SHAREZONE_CHECK_LEASE_TTL'
+RENEW_ENV = 'SHAREZONE_CHECK_LEASE_RENEW'
+
+ACQUIRED_PATTERN = re.compile(r'获得清理任务租约（(.+?)）')
+
+
+def create_app():
+    """工作进程中加载应用（gunicorn 应用入口），先将数据目录和租约参数改为检查用的设置"""
+    import config
+    data_dir = os.environ[DATA_DIR_ENV]
+    config.DATABASE_PATH = os.path.join(data_dir, 'data', 'sharezone.db')
+    config.UPLOAD_FOLDER = os.path.join(data_dir, 'uploads')
+    config.BLOB_FOLDER = os.path.join(config.UPLOAD_FOLDER, 'blobs')
+    config.UPLOAD_PARTS_FOLDER = config.UPLOAD_FOLDER + '_parts'
+    config.LEASE_TTL_SECONDS = int(os.environ[TTL_ENV])
+    config.LEASE_RENEW_SECONDS = int(os.environ[RENEW_ENV])
+    config.SCHEDULER_ENABLED = True
+
+    from app import app
+    return app
+
+
+class Cluster:
+    """用 gunicorn 启动的多进程实例"""
+
+    def __init__(self, workers, ttl, renew):
+        self.workers = workers
+        self.ttl = ttl
+        self.renew = renew
+        self.data_dir = tempfile.mkdtemp(prefix='sharezone-lease-')
+        self.db_path = os.path.join(self.data_dir, 'data', 'sharezone.db')
+        self.log_path = os.path.join(self.data_dir, 'gunicorn.log')
+        self.process = None
+
+    def start(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        env = dict(os.environ, PYTHONUNBUFFERED='1', **{
+            DATA_DIR_ENV: self.data_dir,
+            TTL_ENV: str(self.ttl),
+            RENEW_ENV: str(self.renew),
+        })
+        self.log = open(self.log_path, 'w')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}', '--workers', str(self.workers),
+             '--pythonpath', os.path.join(BASE_DIR, 'benchmarks'),
+             'lease_failover_check:create_app()'],
+            cwd=BASE_DIR, env=env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1):
+                    return
+            except OSError:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f'gunicorn 启动失败，日志见 {self.log_path}')
+                time.sleep(0.2)
+        raise RuntimeError('gunicorn 启动超时')
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.process:
+            self.log.close()
+
+    def get_holder(self):
+        """当前未过期的租约持有者"""
+        if not os.path.exists(self.db_path):
+            return None
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            row = conn.execute(
+                "SELECT holder FROM leases WHERE name = 'cleanup' AND expires_at > ?",
+                (datetime.now(),)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # 数据库尚未初始化完成
+            return None
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def acquisitions(self):
+        """日志中记录的获得租约的持有者（按时间顺序）"""
+        with open(self.log_path, encoding='utf-8', errors='replace') as f:
+            return ACQUIRED_PATTERN.findall(f.read())
+
+    def wait_for_holder(self, timeout, exclude=None):
+        """等待出现（与exclude不同的）持有者，超时返回None"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            holder = self.get_holder()
+            if holder and holder != exclude:
+                return holder
+            time.sleep(0.2)
+        return None
+
+
+def holder_pid(holder):
+    """持有者标识中的进程号（主机名:进程号:随机串）"""
+    return int(holder.split(':')[-2])
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def check(cluster):
+    """依次执行各项检查，返回失败信息列表"""
+    failures = []
+
+    # 1. 只有一个持有者，且在多个续约周期内保持不变
+    holder = cluster.wait_for_holder(cluster.renew * 3 + 10)
+    if holder is None:
+        return ['启动后没有进程获得租约']
+
+    time.sleep(cluster.renew * 3)
+    acquired = cluster.acquisitions()
+    if cluster.get_holder() != holder or acquired != [holder]:
+        failures.append(f'持有者不唯一或不稳定：当前 {cluster.get_holder()}，获得记录 {acquired}')
+    pid = holder_pid(holder)
+    if pid == cluster.process.pid or not is_alive(pid):
+        failures.append(f'持有者 {holder} 不是存活的工作进程')
+    print(f"[租约检查] {cluster.workers} 个工作进程，持有者 {holder}")
+
+    # 2. 强制结束持有者：租约过期后由其他进程接替
+    os.kill(pid, signal.SIGKILL)
+    started = time.monotonic()
+    new_holder = cluster.wait_for_holder(cluster.ttl + cluster.renew * 2 + 10, exclude=holder)
+    if new_holder is None:
+        return failures + ['持有者被强制结束后没有进程接替']
+    print(f"[租约检查] 强制结束 {holder} 后 {time.monotonic() - started:.1f} 秒由 {new_holder} 接替")
+    if not is_alive(holder_pid(new_holder)):
+        failures.append(f'接替者 {new_holder} 不是存活的工作进程')
+
+    # 3. 持有者正常退出：主动释放租约，一个续约间隔内由其他进程接替
+    holder = new_holder
+    os.kill(holder_pid(holder), signal.SIGTERM)
+    started = time.monotonic()
+    new_holder = cluster.wait_for_holder(cluster.renew * 2 + 10, exclude=holder)
+    if new_holder is None:
+        return failures + ['持有者正常退出后没有进程接替']
+    elapsed = time.monotonic() - started
+    print(f"[租约检查] 正常结束 {holder} 后 {elapsed:.1f} 秒由 {new_holder} 接替")
+    if elapsed >= cluster.ttl:
+        failures.append(f'正常退出后 {elapsed:.1f} 秒才被接替，租约可能没有主动释放')
+
+    # 各次获得租约的记录都对应一次切换，不应出现两个进程交替持有
+    acquired = cluster.acquisitions()
+    if len(acquired) != 3 or len(set(acquired)) != 3:
+        failures.append(f'获得租约的记录与预期的切换次数不符：{acquired}')
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多进程部署的定时清理租约检查')
+    parser.add_argument('--workers', type=int, default=3, help='gunicorn 工作进程数（至少2个）')
+    parser.add_argument('--ttl', type=int, default=6, help='检查时使用的租约有效期（秒）')
+    parser.add_argument('--renew', type=int, default=2, help='检查时使用的续约间隔（秒），应小于有效期')
+    parser.add_argument('--keep', action='store_true', help='保留临时目录（数据库和 gunicorn 日志）')
+    args = parser.parse_args()
+    if args.workers < 2 or args.renew >= args.ttl:
+        parser.error('工作进程数至少为2，续约间隔应小于租约有效期')
+
+    cluster = Cluster(args.workers, args.ttl, args.renew)
+    try:
+        cluster.start()
+        failures = check(cluster)
+    finally:
+        cluster.stop()
+        if args.keep:
+            print(f"[租约检查] 临时目录：{cluster.data_dir}")
+        else:
+            shutil.rmtree(cluster.data_dir, ignore_errors=True)
+
+    for failure in failures:
+        print(f"[租约检查] 失败：{failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+    print("[租约检查] 全部通过")
+
+
+if __name__ == '__main__':
+    main()
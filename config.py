@@ -2,30 +2,121 @@ import os
 
 # 基础配置
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+# 空间密码指纹（HMAC）也以此为密钥：更换后已有空间的指纹不再匹配，无法通过密码进入，
+# 需要先执行 UPDATE spaces SET password_fingerprint = NULL，之后在下次输入正确密码时重新生成
 SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-sharezone-2025'
 
 # 端口配置
 PORT = 3333
 
+# 生产服务配置（gunicorn.conf.py），均可通过环境变量覆盖
+# 实时事件在进程内分发，多进程时客户端只能收到同一进程内的事件，因此默认单进程多线程
+SERVER_WORKERS = int(os.environ.get('SHAREZONE_WORKERS', 1))
+SERVER_THREADS = int(os.environ.get('SHAREZONE_THREADS', 32))  # 每个进程的线程数，下载和事件流连接各占一个线程
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SHAREZONE_GRACEFUL_TIMEOUT', 30))  # 退出时等待请求完成的时间（秒）
+SCHEDULER_ENABLED = os.environ.get('SHAREZONE_SCHEDULER', '1') == '1'  # 当前进程是否参与定时清理（由租约选出唯一执行者）
+
 # 系统密码
 SYSTEM_PASSWORD = 'astorm666'
 
 # 数据库配置
 DATABASE_PATH = os.path.join(BASE_DIR, 'data', 'sharezone.db')
+DB_POOL_SIZE = 8  # 连接池最多保留的空闲连接数
+DB_BUSY_TIMEOUT = 5000  # 数据库锁等待时间（毫秒）
+DB_CACHE_SIZE = 8 * 1024  # 每个连接的页缓存大小（KB）
+DB_MMAP_SIZE = 64 * 1024 * 1024  # 内存映射大小（字节）
+
+# 性能指标配置
+SLOW_QUERY_MS = 200  # 慢查询日志阈值（毫秒），None表示不记录
+METRICS_TOKEN = os.environ.get('SHAREZONE_METRICS_TOKEN')  # 设置后访问/metrics需携带 Authorization: Bearer <token>
 
 # 文件上传配置
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
-UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
+# 上传目录不能位于static下，否则文件可绕过权限校验通过静态路由直接下载（按内容哈希命名的路径可被推算）
+UPLOAD_FOLDER = os.path.join(BASE_DIR, 'data', 'uploads')
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 流式上传每次读取的字节数
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')  # 按内容哈希存储的文件目录
+PREVIEW_HEAD_BYTES = 1024  # 上传时保留开头多少字节用于生成文本预览
+
+# 上传后台处理配置（文本解码、图片识别和缩略图）
+PROCESSING_WORKERS = 2  # 后台处理线程数
+PROCESSING_QUEUE_SIZE = 100  # 队列上限，队列满时文件保持待处理状态，由定时任务补处理
+PROCESSING_TIMEOUT_SECONDS = 600  # 处理中的文件超过该时间仍未完成（如进程退出），由定时任务重置为待处理
+
+# 分片上传配置
+MAX_RESUMABLE_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 分片上传的单个文件大小上限（2GB）
+UPLOAD_PART_SIZE = 8 * 1024 * 1024  # 默认分片大小（8MB），单个分片不能超过MAX_FILE_SIZE
+MIN_UPLOAD_PART_SIZE = 256 * 1024  # 最小分片大小
+UPLOAD_SESSION_EXPIRES_HOURS = 24  # 未完成的上传会话保留时间
+UPLOAD_MAX_SESSIONS_PER_SPACE = 5  # 每个空间同时存在的未完成上传会话数（声明的大小计入配额）
+UPLOAD_PARTS_FOLDER = UPLOAD_FOLDER + '_parts'  # 与上传目录同级，完成时直接重命名，无需复制
 
 # Cookie配置
 AUTH_TOKEN_EXPIRES = 7  # 天
 SPACE_TOKEN_EXPIRES = 1  # 天
 
+# 空间访问记录配置
+SPACE_ACCESS_HISTORY_LIMIT = 50  # 空间列表显示的最近访问空间数（不影响已进入空间的访问权限）
+
+# 令牌缓存配置
+TOKEN_CACHE_SIZE = 10000  # 最多缓存的令牌数
+TOKEN_CACHE_TTL = 60  # 缓存有效期（秒），多进程部署时登出最多延迟这么久在其他进程生效
+
 # 清理配置
 FILE_EXPIRES_HOURS = 24
 SPACE_EXPIRES_HOURS = 24
 CLEANUP_INTERVAL_MINUTES = 10
+CLEANUP_BATCH_SIZE = 500  # 清理任务每个事务处理的记录数
+PURGE_RETENTION_DAYS = 7  # 已删除记录保留多少天后从数据库中物理删除
+PURGE_BATCH_SIZE = 200  # 物理删除每个事务处理的记录数（小批量，避免长时间占用写锁）
+MAINTENANCE_QUIET_HOURS = (3, 6)  # 数据库整理（增量VACUUM、ANALYZE）的空闲时段，本地时间[开始, 结束)
+VACUUM_PAGES_PER_STEP = 1000  # 每次增量VACUUM回收的页数
 MAX_EXTEND_DAYS = 7  # 最大延长天数
+LEASE_TTL_SECONDS = 60  # 定时清理租约有效期（秒），持有者失联后最多这么久由其他进程接手
+LEASE_RENEW_SECONDS = 15  # 续约间隔（秒）
+
+# 文件列表分页配置
+FILE_LIST_PAGE_SIZE = 50  # 每页默认条数
+FILE_LIST_MAX_PAGE_SIZE = 200  # 每页最多条数
+
+# 文本编辑配置
+TEXT_PATCH_MAX_OPS = 1000  # 单次补丁最多包含的修改项
+
+# 全文搜索配置
+SEARCH_PAGE_SIZE = 20  # 每页默认条数
+SEARCH_MAX_PAGE_SIZE = 50  # 每页最多条数
+SEARCH_MAX_QUERY_LENGTH = 100  # 搜索词最大长度（字符）
+SEARCH_INDEX_MAX_CHARS = 1000000  # 每个文件写入全文索引的最大字符数，超出部分不参与搜索
+SEARCH_SNIPPET_CHARS = 32  # 搜索结果摘要的长度（字符）
+
+# 压缩配置
+TEXT_COMPRESS_MIN_BYTES = 4 * 1024  # 文本内容超过该字节数时压缩存储
+COMPRESS_MIN_BYTES = 1024  # 响应体超过该字节数时按Accept-Encoding压缩
+COMPRESS_MAX_BYTES = 4 * 1024 * 1024  # 直接发送的文件超过该字节数时不压缩（压缩需将文件读入内存）
+COMPRESS_LEVEL = 6  # gzip压缩级别
+BROTLI_QUALITY = 5  # br压缩级别（需安装brotli）
+
+# 存储配额（None表示不限制），上传、创建文本和编辑文本时检查
+SPACE_QUOTA_BYTES = 4 * 1024 * 1024 * 1024  # 每个空间的总字节数（4GB）
+SPACE_MAX_FILES = 1000  # 每个空间的文件数
+STORAGE_QUOTA_BYTES = int(os.environ.get('SHAREZONE_STORAGE_QUOTA', 50 * 1024 * 1024 * 1024))  # 全站总字节数（默认50GB）
+STORAGE_MAX_FILES = 100000  # 全站文件数
+
+# 批量操作配置
+BATCH_MAX_FILES = 500  # 批量删除、延期、打包下载一次最多指定的文件数
+
+# 实时事件配置
+EVENT_BUFFER_SIZE = 200  # 每个空间保留的最近事件数（断线重连时补发）
+EVENT_QUEUE_SIZE = 100  # 每个连接待发送事件的上限，超过时断开连接由客户端重连补发
+EVENT_MAX_SPACES = 1000  # 最多保留事件的空间数
+EVENT_HEARTBEAT_SECONDS = 15  # 心跳间隔（秒），用于保持连接和及时发现断开
+# 每个进程的事件流连接数上限：每个连接一直占用一个线程，须远小于SERVER_THREADS，给接口和下载留出线程；
+# 超过时返回503，客户端不使用实时事件，操作后重新加载列表
+EVENT_MAX_SUBSCRIBERS = int(os.environ.get('SHAREZONE_EVENT_MAX_SUBSCRIBERS', max(1, SERVER_THREADS // 4)))
+
+# 缩略图配置（图片预览时按需生成，缓存在原文件旁）
+THUMBNAIL_SIZES = {'small': 200, 'medium': 800}  # 名称: 最长边像素
+THUMBNAIL_QUALITY = 80  # WebP质量
 
 # 允许的图片扩展名
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
@@ -1,32 +1,153 @@
+import os
 import sqlite3
+import queue
+import threading
+import time
 from datetime import datetime
 from contextlib import contextmanager
 import config
-from .models import CREATE_TABLES_SQL
+from .models import CREATE_TABLES_SQL, MIGRATIONS
+from utils.metrics import record_query
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录每条SQL耗时的游标"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, time.perf_counter() - start)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """通过InstrumentedCursor执行所有SQL的连接"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
 
 
 class DatabaseManager:
     """数据库管理器"""
 
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, pool_size=None):
         self.db_path = db_path or config.DATABASE_PATH
+        # 空闲连接池（后进先出，优先复用最近使用过的连接）
+        self._pool = queue.LifoQueue(maxsize=pool_size or config.DB_POOL_SIZE)
+        self._pool_lock = threading.Lock()
+        self._closed = False
+        # 直接运行数据库工具脚本时数据目录可能尚未创建
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
         self.init_database()
 
     def init_database(self):
-        """初始化数据库，创建表"""
+        """初始化数据库，创建表并执行未完成的迁移"""
         with self.get_connection() as conn:
             conn.executescript(CREATE_TABLES_SQL)
-            conn.commit()
+
+        for version, description, statements in MIGRATIONS:
+            self._migrate(version, description, statements)
+
+    def _migrate(self, version, description, statements):
+        """执行单个版本的迁移（多个进程同时启动时由写锁串行化）"""
+        with self.transaction() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                return
+
+            for statement in statements:
+                if isinstance(statement, tuple):
+                    _, table, column, definition = statement
+                    columns = [row['name'] for row in conn.execute(f"PRAGMA table_info({table})")]
+                    if column not in columns:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                elif callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            print(f"[数据库] 已迁移到版本 {version}：{description}")
+
+    def _create_connection(self):
+        """创建新连接，并设置连接级PRAGMA（每个连接只设置一次）"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=InstrumentedConnection)
+        conn.row_factory = sqlite3.Row
+        # 新数据库启用增量回收，必须在切换WAL之前设置（已有数据库需VACUUM一次后生效，见CleanupService.maintain_database）
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(config.DB_BUSY_TIMEOUT)}")
+        conn.execute(f"PRAGMA mmap_size = {int(config.DB_MMAP_SIZE)}")
+        # 负数表示以KB为单位
+        conn.execute(f"PRAGMA cache_size = -{int(config.DB_CACHE_SIZE)}")
+        return conn
+
+    def _release_connection(self, conn):
+        """归还连接到连接池，池已满或已关闭时直接关闭连接"""
+        if conn.in_transaction:
+            conn.rollback()
+
+        with self._pool_lock:
+            if not self._closed:
+                try:
+                    self._pool.put_nowait(conn)
+                    return
+                except queue.Full:
+                    pass
+        conn.close()
 
     @contextmanager
     def get_connection(self):
-        """获取数据库连接的上下文管理器"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        """从连接池获取数据库连接的上下文管理器"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._create_connection()
+
         try:
             yield conn
-        finally:
+        except Exception:
             conn.close()
+            raise
+        else:
+            self._release_connection(conn)
+
+    @contextmanager
+    def transaction(self):
+        """事务上下文管理器：立即获取写锁，正常结束时提交，异常时回滚"""
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close_all(self):
+        """关闭连接池中的所有连接（应用退出时调用）"""
+        with self._pool_lock:
+            self._closed = True
+            while True:
+                try:
+                    conn = self._pool.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
 
     def execute(self, query, params=()):
         """执行SQL语句（INSERT, UPDATE, DELETE）"""
@@ -1,6 +1,8 @@
 """
 数据库表结构定义
 """
+import config
+from utils.compression import decode_text
 
 CREATE_TABLES_SQL = """
 -- 空间表
@@ -8,14 +10,14 @@ CREATE TABLE IF NOT EXISTS spaces (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name VARCHAR(100) NOT NULL UNIQUE,
     password_hash VARCHAR(255) NOT NULL UNIQUE,
+    password_fingerprint VARCHAR(64),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     last_accessed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     expires_at TIMESTAMP NOT NULL,
-    is_deleted BOOLEAN DEFAULT 0
+    is_deleted BOOLEAN DEFAULT 0,
+    deleted_at TIMESTAMP
 );
 
-CREATE INDEX IF NOT EXISTS idx_spaces_expires ON spaces(expires_at);
-CREATE INDEX IF NOT EXISTS idx_spaces_password ON spaces(password_hash);
 
 -- 文件表
 CREATE TABLE IF NOT EXISTS files (
@@ -26,17 +28,28 @@ CREATE TABLE IF NOT EXISTS files (
     file_type VARCHAR(50) NOT NULL,
     mime_type VARCHAR(100),
     file_size INTEGER,
+    content_hash VARCHAR(64),
     content TEXT,
     preview_text TEXT,
+    processing_status VARCHAR(20) DEFAULT 'ready',
     file_path VARCHAR(500),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP,
     expires_at TIMESTAMP NOT NULL,
     is_deleted BOOLEAN DEFAULT 0,
+    deleted_at TIMESTAMP,
     FOREIGN KEY (space_id) REFERENCES spaces(id) ON DELETE CASCADE
 );
 
 CREATE INDEX IF NOT EXISTS idx_files_space ON files(space_id);
-CREATE INDEX IF NOT EXISTS idx_files_expires ON files(expires_at);
+
+-- 文件内容表（按内容哈希去重，相同内容只保存一份）
+CREATE TABLE IF NOT EXISTS blobs (
+    content_hash VARCHAR(64) PRIMARY KEY,
+    file_size INTEGER NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
 
 -- 认证令牌表
 CREATE TABLE IF NOT EXISTS auth_tokens (
@@ -47,7 +60,6 @@ CREATE TABLE IF NOT EXISTS auth_tokens (
     is_valid BOOLEAN DEFAULT 1
 );
 
-CREATE INDEX IF NOT EXISTS idx_tokens_token ON auth_tokens(token);
 CREATE INDEX IF NOT EXISTS idx_tokens_expires ON auth_tokens(expires_at);
 
 -- 空间访问记录表
@@ -59,6 +71,145 @@ CREATE TABLE IF NOT EXISTS space_access (
     FOREIGN KEY (space_id) REFERENCES spaces(id) ON DELETE CASCADE
 );
 
-CREATE INDEX IF NOT EXISTS idx_access_token ON space_access(token);
 CREATE INDEX IF NOT EXISTS idx_access_space ON space_access(space_id);
+
+-- 租约表（多进程或多节点部署时选出唯一执行定时清理的进程）
+CREATE TABLE IF NOT EXISTS leases (
+    name VARCHAR(50) PRIMARY KEY,
+    holder VARCHAR(255) NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
+
+-- 分片上传会话表
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id VARCHAR(36) PRIMARY KEY,
+    space_id INTEGER NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    file_size INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    total_chunks INTEGER NOT NULL,
+    part_path VARCHAR(500) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    FOREIGN KEY (space_id) REFERENCES spaces(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_expires ON upload_sessions(expires_at);
+
+-- 已接收分片表
+CREATE TABLE IF NOT EXISTS upload_chunks (
+    session_id VARCHAR(36) NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    PRIMARY KEY (session_id, chunk_index)
+);
 """
+
+
+def _index_existing_files(conn):
+    """将未删除的文件写入全文索引（压缩存储的文本需解压后写入）"""
+    rows = conn.execute(
+        "SELECT id, filename, content, content_encoding FROM files WHERE is_deleted = 0"
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO files_fts (rowid, filename, content) VALUES (?, ?, ?)",
+        ((row['id'], row['filename'],
+          (decode_text(row['content'], row['content_encoding']) or '')[:config.SEARCH_INDEX_MAX_CHARS] or None)
+         for row in rows.fetchall())
+    )
+
+
+# 数据库迁移：(版本号, 说明, 语句列表)
+# 按版本号顺序执行，当前版本记录在 PRAGMA user_version 中。
+# ('add_column', 表名, 字段名, 字段定义) 表示补充字段，字段已存在时跳过；
+# 可调用对象在迁移事务中以连接为参数调用（用于需要在Python中处理数据的迁移）；
+# 其余语句都应可重复执行（IF NOT EXISTS / IF EXISTS），CREATE_TABLES_SQL 中的索引只能引用原始字段。
+MIGRATIONS = [
+    (1, '补充字段及其索引', [
+        ('add_column', 'spaces', 'password_fingerprint', 'VARCHAR(64)'),
+        ('add_column', 'files', 'content_hash', 'VARCHAR(64)'),
+        ('add_column', 'files', 'updated_at', 'TIMESTAMP'),
+        ('add_column', 'files', 'processing_status', "VARCHAR(20) DEFAULT 'ready'"),
+        ('add_column', 'files', 'deleted_at', 'TIMESTAMP'),
+        ('add_column', 'spaces', 'deleted_at', 'TIMESTAMP'),
+        # 密码指纹索引（仅约束未删除的空间）
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_spaces_fingerprint ON spaces(password_fingerprint) WHERE is_deleted = 0",
+        # 已删除记录索引（用于按保留期物理清除）
+        "CREATE INDEX IF NOT EXISTS idx_files_deleted ON files(deleted_at) WHERE is_deleted = 1",
+        "CREATE INDEX IF NOT EXISTS idx_spaces_deleted ON spaces(deleted_at) WHERE is_deleted = 1",
+        # 待处理文件索引
+        "CREATE INDEX IF NOT EXISTS idx_files_processing ON files(processing_status) WHERE processing_status = 'pending'",
+    ]),
+    (2, '按实际查询条件建立复合索引和部分索引', [
+        # 空间文件列表：space_id等值 + created_at排序，过期时间在索引内过滤
+        "CREATE INDEX IF NOT EXISTS idx_files_space_live ON files(space_id, created_at, expires_at) WHERE is_deleted = 0",
+        # 清理任务：只扫描未删除记录的过期时间
+        "CREATE INDEX IF NOT EXISTS idx_files_live_expires ON files(expires_at) WHERE is_deleted = 0",
+        "CREATE INDEX IF NOT EXISTS idx_spaces_live_expires ON spaces(expires_at) WHERE is_deleted = 0",
+        # 以下索引与唯一约束的自动索引重复，或已被上面的部分索引取代
+        "DROP INDEX IF EXISTS idx_tokens_token",
+        "DROP INDEX IF EXISTS idx_spaces_password",
+        "DROP INDEX IF EXISTS idx_files_expires",
+        "DROP INDEX IF EXISTS idx_spaces_expires",
+    ]),
+    (3, '空间访问记录按(令牌, 空间)去重', [
+        # 每组只保留最后插入（即最近访问）的一条
+        """DELETE FROM space_access WHERE id NOT IN (
+               SELECT MAX(id) FROM space_access GROUP BY token, space_id
+           )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_access_token_space ON space_access(token, space_id)",
+        # 按令牌取最近访问的空间，索引内已按访问时间排序
+        "CREATE INDEX IF NOT EXISTS idx_access_token_time ON space_access(token, accessed_at)",
+        "DROP INDEX IF EXISTS idx_access_token",
+    ]),
+    (4, '文件列表按(created_at, id)分页', [
+        # 隐含的rowid紧跟created_at，按(created_at, id)排序和翻页都不需要额外排序
+        "CREATE INDEX IF NOT EXISTS idx_files_space_created ON files(space_id, created_at) WHERE is_deleted = 0",
+        "DROP INDEX IF EXISTS idx_files_space_live",
+    ]),
+    (5, '空间和全站的存储用量计数', [
+        ('add_column', 'spaces', 'used_bytes', 'INTEGER NOT NULL DEFAULT 0'),
+        ('add_column', 'spaces', 'file_count', 'INTEGER NOT NULL DEFAULT 0'),
+        # 文本内容按UTF-8字节数计入用量
+        "UPDATE files SET file_size = length(CAST(content AS BLOB)) WHERE file_type = 'text' AND file_size IS NULL",
+        """UPDATE spaces SET
+               used_bytes = (SELECT COALESCE(SUM(file_size), 0) FROM files WHERE space_id = spaces.id AND is_deleted = 0),
+               file_count = (SELECT COUNT(*) FROM files WHERE space_id = spaces.id AND is_deleted = 0)""",
+        """CREATE TABLE IF NOT EXISTS storage_usage (
+               id INTEGER PRIMARY KEY CHECK (id = 1),
+               used_bytes INTEGER NOT NULL DEFAULT 0,
+               file_count INTEGER NOT NULL DEFAULT 0
+           )""",
+        """INSERT OR REPLACE INTO storage_usage (id, used_bytes, file_count)
+           SELECT 1, COALESCE(SUM(file_size), 0), COUNT(*) FROM files WHERE is_deleted = 0""",
+    ]),
+    (6, '文本内容压缩存储', [
+        # 为空表示content为未压缩的文本，'gzip'表示content为gzip压缩的UTF-8字节
+        ('add_column', 'files', 'content_encoding', 'VARCHAR(10)'),
+    ]),
+    (7, '文本内容版本号', [
+        # 每次修改加一，用于按补丁更新时检测并发修改
+        ('add_column', 'files', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+    ]),
+    (8, '文件名和文本内容全文索引', [
+        # rowid与files.id相同；trigram分词按字符切分，中文无需分词也能检索
+        "CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(filename, content, tokenize='trigram')",
+        # 文件标记删除（手动删除、过期清理、空间删除）或物理删除时移出索引，索引中只保留未删除的文件
+        """CREATE TRIGGER IF NOT EXISTS files_fts_soft_delete AFTER UPDATE OF is_deleted ON files
+           WHEN new.is_deleted = 1 BEGIN
+               DELETE FROM files_fts WHERE rowid = old.id;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+               DELETE FROM files_fts WHERE rowid = old.id;
+           END""",
+        _index_existing_files,
+    ]),
+    (9, '记录后台处理开始时间', [
+        ('add_column', 'files', 'processing_started_at', 'TIMESTAMP'),
+        # 查找处理超时的文件（进程在处理中途退出时遗留）
+        "CREATE INDEX IF NOT EXISTS idx_files_processing_started ON files(processing_started_at) WHERE processing_status = 'processing'",
+    ]),
+    (10, '按空间统计未完成的上传会话', [
+        # 创建会话时统计空间内未完成会话的数量和声明大小（计入配额）
+        "CREATE INDEX IF NOT EXISTS idx_upload_sessions_space ON upload_sessions(space_id)",
+    ]),
+]
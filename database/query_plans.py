@@ -0,0 +1,120 @@
+"""
+热点查询的执行计划检查
+
+修改表结构或查询语句后运行，确认热点查询仍然命中预期的索引：
+    python -m database.query_plans
+"""
+import sys
+from datetime import datetime
+
+# (名称, SQL, 参数, 期望使用的索引)
+HOT_QUERIES = [
+    (
+        '空间文件列表',
+        """SELECT id FROM files
+           WHERE space_id = ? AND is_deleted = 0 AND expires_at > ?
+           ORDER BY created_at DESC, id DESC LIMIT ?""",
+        (1, datetime.now(), 50),
+        'idx_files_space_created'
+    ),
+    (
+        '空间文件列表翻页',
+        """SELECT id FROM files
+           WHERE space_id = ? AND is_deleted = 0 AND expires_at > ? AND (created_at, id) < (?, ?)
+           ORDER BY created_at DESC, id DESC LIMIT ?""",
+        (1, datetime.now(), '', 0, 50),
+        'idx_files_space_created'
+    ),
+    (
+        '密码进入空间',
+        "SELECT * FROM spaces WHERE password_fingerprint = ? AND is_deleted = 0 AND expires_at > ?",
+        ('', datetime.now()),
+        'idx_spaces_fingerprint'
+    ),
+    (
+        '令牌校验',
+        "SELECT expires_at FROM auth_tokens WHERE token = ? AND is_valid = 1 AND expires_at > ?",
+        ('', datetime.now()),
+        'sqlite_autoindex_auth_tokens_1'
+    ),
+    (
+        '文件访问权限校验',
+        """SELECT t.expires_at, sa.id, f.*, s.name FROM auth_tokens t
+           LEFT JOIN files f ON f.id = ? AND f.is_deleted = 0 AND f.expires_at > ?
+           LEFT JOIN spaces s ON s.id = f.space_id AND s.is_deleted = 0 AND s.expires_at > ?
+           LEFT JOIN space_access sa ON sa.token = t.token AND sa.space_id = s.id
+           WHERE t.token = ? AND t.is_valid = 1 AND t.expires_at > ?""",
+        (1, datetime.now(), datetime.now(), '', datetime.now()),
+        'idx_access_token_space'
+    ),
+    (
+        '空间内短词搜索',
+        """SELECT f.id FROM files f JOIN files_fts ON files_fts.rowid = f.id
+           WHERE f.space_id = ? AND f.is_deleted = 0 AND f.expires_at > ?
+             AND instr(lower(files_fts.content), lower(?)) > 0
+           ORDER BY f.created_at DESC, f.id DESC LIMIT ?""",
+        (1, datetime.now(), '', 20),
+        'idx_files_space_created'
+    ),
+    (
+        '已访问空间列表',
+        """SELECT s.* FROM spaces s
+           INNER JOIN space_access sa ON s.id = sa.space_id
+           WHERE sa.token = ? AND s.is_deleted = 0 AND s.expires_at > ?
+           ORDER BY sa.accessed_at DESC
+           LIMIT ?""",
+        ('', datetime.now(), 50),
+        'idx_access_token_time'
+    ),
+    (
+        '过期文件清理',
+        "SELECT id, file_path, content_hash FROM files WHERE expires_at < ? AND is_deleted = 0 LIMIT ?",
+        (datetime.now(), 500),
+        'idx_files_live_expires'
+    ),
+    (
+        '过期空间清理',
+        "SELECT id FROM spaces WHERE expires_at < ? AND is_deleted = 0 LIMIT ?",
+        (datetime.now(), 500),
+        'idx_spaces_live_expires'
+    ),
+    (
+        '待处理文件',
+        """SELECT id FROM files WHERE processing_status = 'pending' AND is_deleted = 0
+           ORDER BY id LIMIT ?""",
+        (100,),
+        'idx_files_processing'
+    ),
+]
+
+
+def explain(conn, sql, params):
+    """获取查询计划，返回每一步的说明文字"""
+    return [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def check_query_plans(db):
+    """检查热点查询的执行计划，返回不符合预期的查询列表"""
+    failures = []
+    with db.get_connection() as conn:
+        for name, sql, params, index in HOT_QUERIES:
+            plan = explain(conn, sql, params)
+            # 未命中索引，或命中索引后仍需要临时B树排序
+            if (not any(f'INDEX {index}' in detail for detail in plan)
+                    or any('TEMP B-TREE' in detail for detail in plan)):
+                failures.append({'name': name, 'expected': index, 'plan': plan})
+    return failures
+
+
+if __name__ == '__main__':
+    from database.db_manager import db
+
+    failures = check_query_plans(db)
+    for failure in failures:
+        print(f"[查询计划] {failure['name']} 未按预期使用索引 {failure['expected']}:")
+        for detail in failure['plan']:
+            print(f"    {detail}")
+
+    if failures:
+        sys.exit(1)
+    print(f"[查询计划] {len(HOT_QUERIES)} 条热点查询均命中预期索引")
@@ -0,0 +1,51 @@
+"""
+gunicorn 配置（生产环境）
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+并发模型：
+- gthread 工作模式，SERVER_WORKERS 个进程，每个进程 SERVER_THREADS 个线程；
+  下载和事件流（SSE）长连接各占用一个线程，文件读写和 SQLite 查询期间会释放 GIL；
+  事件流连接数限制为 EVENT_MAX_SUBSCRIBERS（默认线程数的1/4），超过时返回503，保证接口始终有可用线程。
+- 每个进程各自维护数据库连接池、令牌缓存、后台处理线程和事件订阅；
+  数据库以 WAL 模式运行，多进程读写由 SQLite 的文件锁协调。
+- 每个进程都启动调度器，清理任务只在持有数据库租约的进程中执行（见 services/cleanup_service.py），
+  持有者退出（包括平滑重启）时释放租约，失联时租约过期，均由其他进程接替
+  （可用 benchmarks/lease_failover_check.py 检查）。
+- 收到 SIGTERM 后先关闭事件流连接，再等待进行中的请求最多 SERVER_GRACEFUL_TIMEOUT 秒，
+  退出前等待正在执行的定时任务完成。
+"""
+import signal
+import sys
+# 不能命名为config（gunicorn会将其当作配置项）
+import config as settings
+
+bind = f"0.0.0.0:{settings.PORT}"
+workers = settings.SERVER_WORKERS
+worker_class = 'gthread'
+threads = settings.SERVER_THREADS
+graceful_timeout = settings.SERVER_GRACEFUL_TIMEOUT
+# gthread模式下timeout只用于检测卡死的进程，不限制单个请求（事件流、大文件下载）的时长
+timeout = 60
+keepalive = 5
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    """工作进程加载应用后：收到退出信号时先关闭事件流连接"""
+    from services.event_service import event_service
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def close_events_and_exit(sig, frame):
+        event_service.close_all()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, close_events_and_exit)
+
+
+def worker_exit(server, worker):
+    """工作进程退出：等待正在执行的定时任务完成并释放租约"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.cleanup_service.shutdown()
+
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, jsonify, make_response, redirect, url_for
 from datetime import timedelta
 from services.auth_service import AuthService
+from routes.decorators import login_required
 import config
 
 bp = Blueprint('auth', __name__, url_prefix='/api/auth')
@@ -68,3 +69,10 @@ def verify():
     auth_token = request.cookies.get('auth_token')
     is_valid = auth_service.validate_token(auth_token)
     return jsonify({'success': is_valid})
+
+
+@bp.route('/cache-stats', methods=['GET'])
+@login_required
+def cache_stats():
+    """令牌缓存命中统计"""
+    return jsonify({'success': True, 'stats': auth_service.get_cache_stats()})
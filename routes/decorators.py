@@ -0,0 +1,65 @@
+"""
+路由权限装饰器
+
+在一次数据库查询中校验登录状态、空间（或文件）是否存在以及空间访问权限，
+结果保存在flask.g中供视图函数使用：
+    g.auth_token  当前令牌
+    g.space       当前空间（space_required、file_required）
+    g.file        当前文件（file_required）
+"""
+from functools import wraps
+from flask import request, jsonify, g
+from services.auth_service import AuthService
+
+auth_service = AuthService()
+
+# 授权失败原因对应的HTTP状态码
+ERROR_STATUS = {'login': 401, 'not_found': 404, 'forbidden': 403}
+
+
+def login_required(view):
+    """要求已登录（令牌校验命中缓存时不查询数据库）"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        auth_token = request.cookies.get('auth_token')
+        if not auth_token or not auth_service.validate_token(auth_token):
+            return jsonify({'success': False, 'message': '未登录'}), 401
+
+        g.auth_token = auth_token
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def space_required(view):
+    """要求已登录且有权访问路径中的空间（space_id）"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        error = _authorize(space_id=kwargs['space_id'])
+        if error:
+            return error
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def file_required(view):
+    """要求已登录且有权访问路径中的文件（file_id）所属的空间"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        error = _authorize(file_id=kwargs['file_id'])
+        if error:
+            return error
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _authorize(space_id=None, file_id=None):
+    """校验权限并写入flask.g，失败时返回错误响应"""
+    auth_token = request.cookies.get('auth_token')
+    result = auth_service.authorize(auth_token, space_id=space_id, file_id=file_id)
+    if not result['success']:
+        return jsonify({'success': False, 'message': result['message']}), ERROR_STATUS[result['error']]
+
+    g.auth_token = auth_token
+    g.space = result['space']
+    g.file = result['file']
+    return None
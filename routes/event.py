@@ -0,0 +1,66 @@
+from flask import Blueprint, request, jsonify, Response
+import config
+from services.event_service import event_service, format_sse
+from services.space_service import SpaceService
+from routes.decorators import login_required, space_required
+
+bp = Blueprint('event', __name__)
+space_service = SpaceService()
+
+
+@bp.route('/api/spaces/<int:space_id>/events', methods=['GET'])
+@space_required
+def space_events(space_id):
+    """空间变更事件流（SSE），断线重连时通过Last-Event-ID补发错过的事件"""
+    # 浏览器重连时自动携带Last-Event-ID请求头，首次连接可通过参数指定
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    subscription, missed = event_service.subscribe(space_id, last_event_id)
+    if subscription is None:
+        # 事件流连接会一直占用线程，达到上限后拒绝，避免耗尽线程阻塞其他请求
+        response = jsonify({'success': False, 'message': '实时连接数已达上限'})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+
+    def generate():
+        try:
+            # 断开后3秒重连
+            yield "retry: 3000\n\n"
+            for event in missed:
+                yield format_sse(event)
+
+            while True:
+                event = subscription.get(config.EVENT_HEARTBEAT_SECONDS)
+                if subscription.closed:
+                    break
+                if event is None:
+                    # 心跳：保持连接，并检查空间是否已过期
+                    if not space_service.get_space_by_id(space_id):
+                        break
+                    yield ": ping\n\n"
+                    continue
+
+                yield format_sse(event)
+                if event['type'] == 'space_deleted':
+                    break
+        finally:
+            event_service.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    # 生成器未开始执行就断开时不会执行finally，关闭响应时同样取消订阅（重复取消无影响）
+    response.call_on_close(lambda: event_service.unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    # 禁止反向代理缓冲事件流
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@bp.route('/api/events/stats', methods=['GET'])
+@login_required
+def event_stats():
+    """获取事件订阅状态"""
+    return jsonify({'success': True, 'stats': event_service.get_stats()})
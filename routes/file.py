@@ -1,40 +1,45 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, g
+from datetime import datetime, timezone
+import hashlib
+import config
 from services.file_service import FileService
-from services.space_service import SpaceService
-from services.auth_service import AuthService
+from services.quota_service import quota_service
+from services.search_service import search_service
+from services.space_service import public_space
+from routes.decorators import space_required, file_required
+from utils.file_handler import stream_zip
+from utils.validators import validate_extend_hours
+from utils.compression import accepts_encoding
+from utils.metrics import DOWNLOAD_BYTES
 
 bp = Blueprint('file', __name__)
 file_service = FileService()
-space_service = SpaceService()
-auth_service = AuthService()
+
+EXTEND_HOURS_MESSAGE = f'延长时间应为1到{config.MAX_EXTEND_DAYS * 24}小时'
 
 
 @bp.route('/api/spaces/<int:space_id>/files', methods=['GET'])
+@space_required
 def get_files(space_id):
-    """获取空间内的文件列表"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
-    space = space_service.get_space_by_id(space_id)
-    if not space:
-        return jsonify({'success': False, 'message': '空间不存在'}), 404
+    """获取空间内的文件列表（只含元数据和预览，支持分页）"""
+    result = file_service.list_files(
+        space_id,
+        limit=request.args.get('limit', type=int),
+        cursor=request.args.get('cursor'),
+        since=request.args.get('since')
+    )
+    if not result['success']:
+        return jsonify(result), 400
 
-    files = file_service.get_files_by_space(space_id)
-    return jsonify({'success': True, 'files': files, 'space': space})
+    result['space'] = public_space(g.space)
+    result['usage'] = quota_service.get_usage(g.space)
+    return jsonify(result)
 
 
 @bp.route('/api/spaces/<int:space_id>/files', methods=['POST'])
+@space_required
 def upload_file(space_id):
     """上传文件或提交文本"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
-    space = space_service.get_space_by_id(space_id)
-    if not space:
-        return jsonify({'success': False, 'message': '空间不存在'}), 404
-
     # 判断是文本还是文件
     if request.content_type and 'application/json' in request.content_type:
         # 文本内容
@@ -44,7 +49,9 @@ def upload_file(space_id):
 
         if content_type == 'text' and content:
             result = file_service.create_text_content(space_id, content)
-            return jsonify(result)
+            if result['success']:
+                return jsonify(result)
+            return jsonify(result), 400
         else:
             return jsonify({'success': False, 'message': '参数错误'}), 400
     else:
@@ -63,99 +70,256 @@ def upload_file(space_id):
             return jsonify(result), 400
 
 
+@bp.route('/api/spaces/<int:space_id>/files/stream', methods=['POST'])
+@space_required
+def upload_file_stream(space_id):
+    """流式上传文件（请求体即文件内容，文件名通过filename参数传递）"""
+    filename = request.args.get('filename', '')
+    if filename == '':
+        return jsonify({'success': False, 'message': '文件名为空'}), 400
+
+    # 声明的长度已超限时直接拒绝，不读取请求体
+    if request.content_length is not None and request.content_length > config.MAX_FILE_SIZE:
+        return jsonify({'success': False, 'message': '文件大小超过20MB限制'}), 413
+
+    # 声明的长度超出存储配额时同样直接拒绝（写入完成后会按实际大小再次检查）
+    if request.content_length is not None:
+        error = quota_service.check(space_id, request.content_length)
+        if error:
+            return jsonify({'success': False, 'message': error}), 413
+
+    result = file_service.upload_stream(space_id, filename, request.stream)
+    if result['success']:
+        return jsonify(result)
+    else:
+        return jsonify(result), 400
+
+
+@bp.route('/api/spaces/<int:space_id>/files/batch-delete', methods=['POST'])
+@space_required
+def batch_delete_files(space_id):
+    """批量删除文件"""
+    file_ids = _parse_file_ids((request.get_json(silent=True) or {}).get('ids'))
+    if not file_ids:
+        return jsonify({'success': False, 'message': f'请指定1到{config.BATCH_MAX_FILES}个文件'}), 400
+
+    return jsonify(file_service.delete_files(space_id, file_ids))
+
+
+@bp.route('/api/spaces/<int:space_id>/files/batch-extend', methods=['POST'])
+@space_required
+def batch_extend_files(space_id):
+    """批量延长文件过期时间"""
+    data = request.get_json(silent=True) or {}
+    file_ids = _parse_file_ids(data.get('ids'))
+    if not file_ids:
+        return jsonify({'success': False, 'message': f'请指定1到{config.BATCH_MAX_FILES}个文件'}), 400
+
+    hours = data.get('hours', 24)
+    if not validate_extend_hours(hours):
+        return jsonify({'success': False, 'message': EXTEND_HOURS_MESSAGE}), 400
+
+    return jsonify(file_service.extend_files_expiry(space_id, file_ids, hours))
+
+
+@bp.route('/api/spaces/<int:space_id>/files/archive', methods=['GET'])
+@space_required
+def download_archive(space_id):
+    """打包下载文件（ids参数为逗号分隔的文件ID，不指定时打包空间内全部文件），边打包边发送"""
+    file_ids = None
+    if request.args.get('ids'):
+        file_ids = _parse_file_ids(request.args['ids'].split(','))
+        if not file_ids:
+            return jsonify({'success': False, 'message': f'请指定1到{config.BATCH_MAX_FILES}个文件'}), 400
+
+    entries = file_service.get_archive_entries(space_id, file_ids)
+    if not entries:
+        return jsonify({'success': False, 'message': '没有可下载的文件'}), 404
+
+    route = request.url_rule.rule
+
+    def generate():
+        for chunk in stream_zip(entries):
+            DOWNLOAD_BYTES.inc(len(chunk), route)
+            yield chunk
+
+    response = Response(generate(), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=f'space-{space_id}.zip')
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+
+@bp.route('/api/spaces/<int:space_id>/search', methods=['GET'])
+@space_required
+def search_files(space_id):
+    """搜索空间内的文件名和文本内容（按相关度排序，offset为上一页返回的next_offset）"""
+    result = search_service.search(
+        space_id,
+        request.args.get('q'),
+        limit=request.args.get('limit', type=int),
+        offset=request.args.get('offset', type=int)
+    )
+    if not result['success']:
+        return jsonify(result), 400
+    return jsonify(result)
+
+
+def _parse_file_ids(values):
+    """解析文件ID列表（去重并保持顺序），不合法或超过上限时返回None"""
+    if not isinstance(values, list) or not 0 < len(values) <= config.BATCH_MAX_FILES:
+        return None
+    try:
+        file_ids = [int(value) for value in values]
+    except (TypeError, ValueError):
+        return None
+    return list(dict.fromkeys(file_ids))
+
+
 @bp.route('/api/files/<int:file_id>', methods=['GET'])
+@file_required
 def get_file(file_id):
     """获取文件信息"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
-    file = file_service.get_file_by_id(file_id)
-    if not file:
-        return jsonify({'success': False, 'message': '文件不存在'}), 404
-
+    file = dict(g.file)
+    file['content'] = file_service.get_text(file)
+    # 存储路径和内容哈希只在服务端使用，不返回给客户端
+    for key in ('content_encoding', 'file_path', 'stored_filename', 'content_hash'):
+        del file[key]
     return jsonify({'success': True, 'file': file})
 
 
 @bp.route('/api/files/<int:file_id>/content', methods=['GET'])
+@file_required
 def get_file_content(file_id):
-    """获取文件内容（用于预览图片）"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
+    """获取文件内容（用于预览图片，图片可通过size参数获取缩略图）"""
+    file = g.file
 
-    result = file_service.get_file_content(file_id)
-    if not result:
-        return jsonify({'success': False, 'message': '文件不存在'}), 404
+    size = request.args.get('size')
+    if size:
+        if size not in config.THUMBNAIL_SIZES:
+            return jsonify({'success': False, 'message': '不支持的缩略图尺寸'}), 400
 
-    content, mime_type = result
+        thumb_path = file_service.get_thumbnail(file, size)
+        if thumb_path:
+            return _file_response(file, rendition=(thumb_path, 'image/webp', size))
 
-    if isinstance(content, bytes):
-        # 文本内容
-        from flask import Response
-        return Response(content, mimetype=mime_type)
-    else:
-        # 文件路径
-        return send_file(content, mimetype=mime_type)
+    return _file_response(file)
 
 
 @bp.route('/api/files/<int:file_id>/download', methods=['GET'])
+@file_required
 def download_file(file_id):
     """下载文件"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
+    return _file_response(g.file, as_attachment=True)
+
 
-    file = file_service.get_file_by_id(file_id)
-    if not file:
-        return jsonify({'success': False, 'message': '文件不存在'}), 404
+def _file_response(file, as_attachment=False, rendition=None):
+    """构造文件响应
 
+    以内容哈希作为强ETag，支持If-None-Match（304）和Range（206）。
+    上传的文件内容不会变化，按剩余有效期缓存；文本内容可编辑，每次使用前需重新校验。
+    压缩存储的文本在客户端支持gzip时原样发送（Content-Encoding: gzip），否则解压后发送。
+    rendition为(路径, MIME类型, 名称)时返回该衍生文件（如缩略图）。
+    """
     if file['file_type'] == 'text':
         # 文本内容
-        from flask import Response
-        content = file['content'].encode('utf-8')
-        return Response(
-            content,
-            mimetype='text/plain',
-            headers={'Content-Disposition': 'attachment; filename=text.txt'}
-        )
-    else:
-        # 文件
-        return send_file(
-            file['file_path'],
-            as_attachment=True,
-            download_name=file['filename']
-        )
+        send_gzip = file['content_encoding'] == 'gzip' and accepts_encoding('gzip')
+        if send_gzip:
+            content = file['content']
+            etag = f"{file['content_hash']}-gzip"
+        else:
+            content = file_service.get_text(file).encode('utf-8')
+            etag = file['content_hash'] or hashlib.sha256(content).hexdigest()
+
+        response = Response(content, mimetype='text/plain' if as_attachment else 'text/plain; charset=utf-8')
+        if as_attachment:
+            response.headers['Content-Disposition'] = 'attachment; filename=text.txt'
+        if send_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(etag)
+        response.last_modified = _parse_utc(file['updated_at'] or file['created_at'])
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(content))
+
+    # 文件
+    expires_at = file['expires_at']
+    expires_at = datetime.fromisoformat(expires_at) if isinstance(expires_at, str) else expires_at
+    file_path, mime_type, etag = file['file_path'], file['mime_type'], file['content_hash'] or True
+    if rendition:
+        file_path, mime_type, rendition_name = rendition
+        etag = f"{file['content_hash']}-{rendition_name}" if file['content_hash'] else True
+
+    response = send_file(
+        file_path,
+        mimetype=mime_type,
+        as_attachment=as_attachment,
+        download_name=file['filename'],
+        etag=etag,
+        last_modified=_parse_utc(file['created_at'])
+    )
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = max(int((expires_at - datetime.now()).total_seconds()), 0)
+    response.expires = expires_at.astimezone(timezone.utc)
+    return response
+
+
+def _parse_utc(value):
+    """解析数据库中的UTC时间（CURRENT_TIMESTAMP）"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
 
 
 @bp.route('/api/files/<int:file_id>', methods=['PUT'])
+@file_required
 def update_file(file_id):
-    """更新文件（仅文本）"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
+    """更新文件（仅文本），可通过base_version指定基于的版本"""
     data = request.get_json()
     content = data.get('content')
 
     if content is None:
         return jsonify({'success': False, 'message': '内容不能为空'}), 400
 
-    result = file_service.update_text_content(file_id, content)
+    base_version = data.get('base_version')
+    if base_version is not None and not isinstance(base_version, int):
+        return jsonify({'success': False, 'message': '版本号不合法'}), 400
+
+    result = file_service.update_text_content(g.file, content, base_version)
+    return _update_response(result)
+
+
+@bp.route('/api/files/<int:file_id>', methods=['PATCH'])
+@file_required
+def patch_file(file_id):
+    """按补丁更新文本：{"base_version": 版本, "ops": [{"pos", "delete", "insert"}, ...]}
+
+    base_version与当前版本不同时返回409及当前版本号，客户端重新加载后再提交。
+    """
+    data = request.get_json(silent=True) or {}
+    base_version = data.get('base_version')
+    if not isinstance(base_version, int):
+        return jsonify({'success': False, 'message': '版本号不合法'}), 400
+
+    result = file_service.patch_text_content(g.file, base_version, data.get('ops'))
+    return _update_response(result)
+
+
+def _update_response(result):
+    """文本更新结果：冲突返回409，其他失败返回400"""
     if result['success']:
         return jsonify(result)
-    else:
-        return jsonify(result), 400
+    if result.get('conflict'):
+        return jsonify(result), 409
+    return jsonify(result), 400
 
 
 @bp.route('/api/files/<int:file_id>', methods=['DELETE'])
+@file_required
 def delete_file(file_id):
     """删除文件"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
-    result = file_service.delete_file(file_id)
+    result = file_service.delete_file(g.file)
     if result['success']:
         return jsonify(result)
     else:
@@ -163,16 +327,15 @@ def delete_file(file_id):
 
 
 @bp.route('/api/files/<int:file_id>/extend', methods=['POST'])
+@file_required
 def extend_file(file_id):
     """延长文件过期时间"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
-    data = request.get_json() or {}
+    data = request.get_json(silent=True) or {}
     hours = data.get('hours', 24)
+    if not validate_extend_hours(hours):
+        return jsonify({'success': False, 'message': EXTEND_HOURS_MESSAGE}), 400
 
-    result = file_service.extend_file_expiry(file_id, hours)
+    result = file_service.extend_file_expiry(g.file, hours)
 
     if result['success']:
         return jsonify(result)
@@ -0,0 +1,67 @@
+from flask import Blueprint, request, jsonify, Response, g
+import hmac
+import time
+import config
+from services.auth_service import AuthService
+from services.event_service import event_service
+from services.processing_service import processing_service
+from services.quota_service import quota_service
+from utils.metrics import (registry, start_request, finish_request, REQUEST_DURATION, REQUEST_DB_QUERIES,
+                           REQUEST_DB_DURATION, DOWNLOAD_BYTES)
+
+bp = Blueprint('metrics', __name__)
+auth_service = AuthService()
+
+# 计入下载字节数的接口
+DOWNLOAD_ENDPOINTS = {'file.get_file_content', 'file.download_file'}
+
+registry.gauge('sharezone_processing_queue_length', '后台处理队列中的文件数',
+               lambda: processing_service.get_stats()['queued'])
+registry.gauge('sharezone_event_subscribers', '当前进程的事件流连接数',
+               lambda: event_service.get_stats()['subscribers'])
+registry.gauge('sharezone_storage_used_bytes', '全站未删除文件的总字节数',
+               lambda: quota_service.get_totals()['used_bytes'])
+registry.gauge('sharezone_storage_files', '全站未删除的文件数',
+               lambda: quota_service.get_totals()['file_count'])
+
+
+@bp.before_app_request
+def start_request_timer():
+    """记录请求开始时间，重置SQL统计"""
+    g.request_start = time.perf_counter()
+    start_request()
+
+
+@bp.after_app_request
+def record_request_metrics(response):
+    """记录请求耗时、SQL数量和耗时、下载字节数"""
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_DURATION.observe(time.perf_counter() - start, request.method, route, response.status_code)
+
+    queries, db_seconds = finish_request()
+    REQUEST_DB_QUERIES.observe(queries, route)
+    REQUEST_DB_DURATION.observe(db_seconds, route)
+
+    if request.endpoint in DOWNLOAD_ENDPOINTS and request.method == 'GET' and response.content_length:
+        DOWNLOAD_BYTES.inc(response.content_length, route)
+
+    return response
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus指标（配置了METRICS_TOKEN时使用Bearer令牌，否则需要登录）"""
+    if config.METRICS_TOKEN:
+        expected = f"Bearer {config.METRICS_TOKEN}"
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return jsonify({'success': False, 'message': '未授权'}), 401
+    else:
+        auth_token = request.cookies.get('auth_token')
+        if not auth_token or not auth_service.validate_token(auth_token):
+            return jsonify({'success': False, 'message': '未登录'}), 401
+
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -1,7 +1,8 @@
-from flask import Blueprint, render_template, request, jsonify, make_response, redirect
-from datetime import timedelta
+from flask import Blueprint, render_template, request, jsonify, make_response, redirect, g
 from services.space_service import SpaceService
 from services.auth_service import AuthService
+from routes.decorators import login_required, space_required
+from utils.validators import validate_extend_hours
 import config
 
 bp = Blueprint('space', __name__)
@@ -20,31 +21,25 @@ def home_page():
 
 @bp.route('/space/<int:space_id>')
 def space_page(space_id):
-    """空间页面"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return redirect('/api/auth/login-page')
+    """空间页面（未进入过该空间时返回首页输入密码）"""
+    result = auth_service.authorize(request.cookies.get('auth_token'), space_id=space_id)
+    if not result['success']:
+        return redirect('/api/auth/login-page' if result['error'] == 'login' else '/home')
     return render_template('space.html', space_id=space_id)
 
 
 @bp.route('/api/spaces', methods=['GET'])
+@login_required
 def get_spaces():
     """获取空间列表"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
-    spaces = space_service.get_spaces_by_token(auth_token)
+    spaces = space_service.get_spaces_by_token(g.auth_token)
     return jsonify({'success': True, 'spaces': spaces})
 
 
 @bp.route('/api/spaces', methods=['POST'])
+@login_required
 def create_space():
     """创建空间"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
     data = request.get_json()
     name = data.get('name')
     password = data.get('password')
@@ -56,13 +51,14 @@ def create_space():
 
     if result['success']:
         # 记录访问
-        space_service.record_space_access(auth_token, result['space_id'])
+        space_service.record_space_access(g.auth_token, result['space_id'])
 
-        # 设置空间密码cookie
+        # 设置空间密码cookie（密码哈希不放在响应内容中）
+        password_hash = result.pop('password_hash')
         response = make_response(jsonify(result))
         response.set_cookie(
             f'space_{result["space_id"]}',
-            result['password_hash'],
+            password_hash,
             max_age=config.SPACE_TOKEN_EXPIRES * 24 * 60 * 60,
             httponly=True,
             samesite='Lax'
@@ -73,12 +69,9 @@ def create_space():
 
 
 @bp.route('/api/spaces/enter', methods=['POST'])
+@login_required
 def enter_space():
     """进入空间"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
     data = request.get_json()
     password = data.get('password')
 
@@ -90,13 +83,14 @@ def enter_space():
     if result['success']:
         space = result['space']
         # 记录访问
-        space_service.record_space_access(auth_token, space['id'])
+        space_service.record_space_access(g.auth_token, space['id'])
 
-        # 设置空间密码cookie
+        # 设置空间密码cookie（密码哈希不放在响应内容中）
+        password_hash = result.pop('password_hash')
         response = make_response(jsonify(result))
         response.set_cookie(
             f'space_{space["id"]}',
-            space['password_hash'],
+            password_hash,
             max_age=config.SPACE_TOKEN_EXPIRES * 24 * 60 * 60,
             httponly=True,
             samesite='Lax'
@@ -107,12 +101,9 @@ def enter_space():
 
 
 @bp.route('/api/spaces/<int:space_id>', methods=['DELETE'])
+@space_required
 def delete_space(space_id):
     """删除空间"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
     result = space_service.delete_space(space_id)
 
     if result['success']:
@@ -125,27 +116,23 @@ def delete_space(space_id):
 
 
 @bp.route('/api/spaces/<int:space_id>/access', methods=['PUT'])
+@space_required
 def update_access(space_id):
     """更新访问时间"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
-    space_service.record_space_access(auth_token, space_id)
+    space_service.record_space_access(g.auth_token, space_id)
     return jsonify({'success': True})
 
 
 @bp.route('/api/spaces/<int:space_id>/extend', methods=['POST'])
+@space_required
 def extend_space(space_id):
     """延长空间过期时间"""
-    auth_token = request.cookies.get('auth_token')
-    if not auth_token or not auth_service.validate_token(auth_token):
-        return jsonify({'success': False, 'message': '未登录'}), 401
-
-    data = request.get_json() or {}
+    data = request.get_json(silent=True) or {}
     hours = data.get('hours', 24)
+    if not validate_extend_hours(hours):
+        return jsonify({'success': False, 'message': f'延长时间应为1到{config.MAX_EXTEND_DAYS * 24}小时'}), 400
 
-    result = space_service.extend_space_expiry(space_id, hours)
+    result = space_service.extend_space_expiry(g.space, hours)
 
     if result['success']:
         return jsonify(result)
@@ -0,0 +1,67 @@
+from flask import Blueprint, request, jsonify
+from services.upload_service import UploadService
+from routes.decorators import space_required
+
+bp = Blueprint('upload', __name__)
+upload_service = UploadService()
+
+# 创建会话失败的原因对应的状态码（其余为参数错误）
+CREATE_ERROR_STATUS = {'quota': 413, 'limit': 429}
+
+
+@bp.route('/api/spaces/<int:space_id>/uploads', methods=['POST'])
+@space_required
+def create_upload(space_id):
+    """创建分片上传会话"""
+    data = request.get_json() or {}
+    filename = data.get('filename')
+    file_size = data.get('file_size')
+
+    if not filename or file_size is None:
+        return jsonify({'success': False, 'message': '参数错误'}), 400
+
+    # 创建会话时按声明的大小检查配额，避免上传完成后才发现空间不足（完成时会再次检查并占用）
+    result = upload_service.create_session(space_id, filename, file_size, data.get('chunk_size'))
+    if result['success']:
+        return jsonify(result)
+    return jsonify(result), CREATE_ERROR_STATUS.get(result.get('error'), 400)
+
+
+@bp.route('/api/spaces/<int:space_id>/uploads/<upload_id>', methods=['GET'])
+@space_required
+def get_upload(space_id, upload_id):
+    """查询上传进度（已接收的分片）"""
+    result = upload_service.get_status(space_id, upload_id)
+    if result['success']:
+        return jsonify(result)
+    return jsonify(result), 404
+
+
+@bp.route('/api/spaces/<int:space_id>/uploads/<upload_id>/chunks/<int:chunk_index>', methods=['PUT'])
+@space_required
+def upload_chunk(space_id, upload_id, chunk_index):
+    """上传分片（请求体即分片内容）"""
+    result = upload_service.upload_chunk(space_id, upload_id, chunk_index, request.stream)
+    if result['success']:
+        return jsonify(result)
+    return jsonify(result), 400
+
+
+@bp.route('/api/spaces/<int:space_id>/uploads/<upload_id>/complete', methods=['POST'])
+@space_required
+def complete_upload(space_id, upload_id):
+    """完成分片上传"""
+    result = upload_service.complete(space_id, upload_id)
+    if result['success']:
+        return jsonify(result)
+    return jsonify(result), 400
+
+
+@bp.route('/api/spaces/<int:space_id>/uploads/<upload_id>', methods=['DELETE'])
+@space_required
+def abort_upload(space_id, upload_id):
+    """取消分片上传"""
+    result = upload_service.abort(space_id, upload_id)
+    if result['success']:
+        return jsonify(result)
+    return jsonify(result), 400
@@ -3,6 +3,14 @@ import hashlib
 from datetime import datetime, timedelta
 import config
 from database.db_manager import db
+from utils.cache import TTLCache
+
+# 已验证令牌缓存（进程内共享），过期时间不超过令牌本身的有效期
+_token_cache = TTLCache(maxsize=config.TOKEN_CACHE_SIZE, ttl=config.TOKEN_CACHE_TTL)
+
+# 空间表的列（与文件表联查时加前缀区分同名列）
+SPACE_COLUMNS = ('id', 'name', 'password_hash', 'password_fingerprint', 'created_at',
+                 'last_accessed_at', 'expires_at', 'is_deleted', 'deleted_at', 'used_bytes', 'file_count')
 
 
 class AuthService:
@@ -35,16 +43,83 @@ class AuthService:
         if not token:
             return False
 
+        if _token_cache.get(token):
+            return True
+
+        # 在查询之前取得失效代数，查询期间令牌被注销时不写入缓存
+        generation = _token_cache.generation()
+        now = datetime.now()
         result = db.query_one(
-            "SELECT * FROM auth_tokens WHERE token = ? AND is_valid = 1 AND expires_at > ?",
-            (token, datetime.now())
+            "SELECT expires_at FROM auth_tokens WHERE token = ? AND is_valid = 1 AND expires_at > ?",
+            (token, now)
         )
+        if result is None:
+            return False
+
+        expires_at = datetime.fromisoformat(result['expires_at']) if isinstance(result['expires_at'], str) else result['expires_at']
+        _token_cache.set(token, True, ttl=(expires_at - now).total_seconds(), generation=generation)
+        return True
+
+    def authorize(self, token, space_id=None, file_id=None):
+        """一次查询同时校验令牌、空间（或文件及其所属空间）和空间访问权限
+
+        令牌须曾通过密码进入该空间（存在访问记录）才能访问空间及其中的文件。
+        成功返回{'success': True, 'space': 空间, 'file': 文件}，
+        失败时error为'login'（未登录）、'not_found'（不存在）或'forbidden'（无权访问）。
+        """
+        if not token:
+            return {'success': False, 'error': 'login', 'message': '未登录'}
+
+        now = datetime.now()
+        space_columns = ', '.join(f's.{column} AS space__{column}' for column in SPACE_COLUMNS)
+        if file_id is not None:
+            sql = f"""SELECT t.expires_at AS token_expires_at, sa.id AS access_id, f.*, {space_columns}
+                      FROM auth_tokens t
+                      LEFT JOIN files f ON f.id = ? AND f.is_deleted = 0 AND f.expires_at > ?
+                      LEFT JOIN spaces s ON s.id = f.space_id AND s.is_deleted = 0 AND s.expires_at > ?
+                      LEFT JOIN space_access sa ON sa.token = t.token AND sa.space_id = s.id
+                      WHERE t.token = ? AND t.is_valid = 1 AND t.expires_at > ?"""
+            params = (file_id, now, now, token, now)
+        else:
+            sql = f"""SELECT t.expires_at AS token_expires_at, sa.id AS access_id, {space_columns}
+                      FROM auth_tokens t
+                      LEFT JOIN spaces s ON s.id = ? AND s.is_deleted = 0 AND s.expires_at > ?
+                      LEFT JOIN space_access sa ON sa.token = t.token AND sa.space_id = s.id
+                      WHERE t.token = ? AND t.is_valid = 1 AND t.expires_at > ?"""
+            params = (space_id, now, token, now)
+
+        generation = _token_cache.generation()
+        row = db.query_one(sql, params)
+        if row is None:
+            _token_cache.delete(token)
+            return {'success': False, 'error': 'login', 'message': '未登录'}
+
+        expires_at = row.pop('token_expires_at')
+        expires_at = datetime.fromisoformat(expires_at) if isinstance(expires_at, str) else expires_at
+        _token_cache.set(token, True, ttl=(expires_at - now).total_seconds(), generation=generation)
 
-        return result is not None
+        access_id = row.pop('access_id')
+        space = {column: row.pop(f'space__{column}') for column in SPACE_COLUMNS}
+        if space['id'] is None:
+            return {'success': False, 'error': 'not_found',
+                    'message': '文件不存在' if file_id is not None else '空间不存在'}
+        if access_id is None:
+            return {'success': False, 'error': 'forbidden', 'message': '无权访问该空间，请先输入空间密码'}
+
+        return {'success': True, 'space': space, 'file': row if file_id is not None else None}
 
     def invalidate_token(self, token):
-        """使令牌失效"""
+        """使令牌失效
+
+        先更新数据库再移出缓存。移出缓存使失效代数加一，更新之前已开始查询的并发请求
+        即使读到仍有效的令牌也不会再写入缓存（见TTLCache.set的generation参数）。
+        """
         db.execute(
             "UPDATE auth_tokens SET is_valid = 0 WHERE token = ?",
             (token,)
         )
+        _token_cache.delete(token)
+
+    def get_cache_stats(self):
+        """获取令牌缓存的命中统计"""
+        return _token_cache.stats()
@@ -0,0 +1,120 @@
+import os
+import uuid
+import config
+from database.db_manager import db
+from utils.file_handler import delete_physical_file, get_thumbnail_paths
+
+
+class BlobService:
+    """按内容哈希去重的文件存储
+
+    相同内容的文件只在磁盘上保存一份，blobs表记录引用计数，
+    最后一个引用释放时才删除物理文件。计数相关方法都在调用方的事务中执行，
+    事务持有写锁，保证计数变化与文件的移动不会交错；释放引用后的文件删除在事务提交后进行，
+    事务回滚时文件仍在原处。
+    """
+
+    def get_blob_path(self, content_hash):
+        """获取内容哈希对应的存储路径"""
+        return os.path.join(config.BLOB_FOLDER, content_hash[:2], content_hash)
+
+    def store(self, conn, temp_path, content_hash, file_size):
+        """登记一份内容并返回其存储路径
+
+        内容已存在时只增加引用计数并删除临时文件，否则将临时文件移动到存储路径。
+        """
+        blob_path = self.get_blob_path(content_hash)
+        conn.execute(
+            """INSERT INTO blobs (content_hash, file_size, ref_count) VALUES (?, ?, 1)
+               ON CONFLICT(content_hash) DO UPDATE SET ref_count = ref_count + 1""",
+            (content_hash, file_size)
+        )
+        row = conn.execute(
+            "SELECT ref_count FROM blobs WHERE content_hash = ?",
+            (content_hash,)
+        ).fetchone()
+
+        if row['ref_count'] == 1 or not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(temp_path, blob_path)
+        else:
+            delete_physical_file(temp_path)
+
+        return blob_path
+
+    def release_files(self, conn, files):
+        """释放一批文件记录的引用，返回(需要删除的路径, 引用数归零的内容哈希)
+
+        只在事务内更新计数，不移动文件；事务提交后调用delete_released删除。
+        旧记录不在去重存储中，直接返回其文件路径。
+        """
+        released_counts = {}
+        paths = []
+        for file in files:
+            if not file['file_path']:
+                continue
+
+            content_hash = file['content_hash']
+            if content_hash and file['file_path'] == self.get_blob_path(content_hash):
+                released_counts[content_hash] = released_counts.get(content_hash, 0) + 1
+            else:
+                paths.append(file['file_path'])
+                paths.extend(get_thumbnail_paths(file['file_path']))
+
+        if not released_counts:
+            return paths, []
+
+        conn.executemany(
+            "UPDATE blobs SET ref_count = ref_count - ? WHERE content_hash = ?",
+            [(count, content_hash) for content_hash, count in released_counts.items()]
+        )
+        unreferenced = []
+        for content_hash in released_counts:
+            row = conn.execute(
+                "SELECT ref_count FROM blobs WHERE content_hash = ?",
+                (content_hash,)
+            ).fetchone()
+            if row and row['ref_count'] <= 0:
+                unreferenced.append(content_hash)
+
+        conn.executemany(
+            "DELETE FROM blobs WHERE content_hash = ?",
+            [(content_hash,) for content_hash in unreferenced]
+        )
+
+        return paths, unreferenced
+
+    def delete_released(self, paths, content_hashes):
+        """删除release_files返回的文件（在其事务提交后调用）
+
+        引用数归零的内容在写锁下确认blobs表中仍没有记录后才重命名为待删除文件，
+        期间并发上传了相同内容（store重新登记）的保留；释放写锁后再真正删除。
+        """
+        for path in paths:
+            delete_physical_file(path)
+        if not content_hashes:
+            return
+
+        trash_paths = []
+        with db.transaction() as conn:
+            placeholders = ', '.join('?' * len(content_hashes))
+            stored = {
+                row['content_hash'] for row in conn.execute(
+                    f"SELECT content_hash FROM blobs WHERE content_hash IN ({placeholders})",
+                    content_hashes
+                )
+            }
+            for content_hash in content_hashes:
+                if content_hash in stored:
+                    continue
+                blob_path = self.get_blob_path(content_hash)
+                trash_path = f"{blob_path}.{uuid.uuid4().hex}.deleted"
+                try:
+                    os.replace(blob_path, trash_path)
+                    trash_paths.append(trash_path)
+                except FileNotFoundError:
+                    pass
+                trash_paths.extend(get_thumbnail_paths(blob_path))
+
+        for path in trash_paths:
+            delete_physical_file(path)
@@ -1,70 +1,108 @@
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime
+import argparse
+import sys
+from datetime import datetime, timedelta
+import time
 import config
 from database.db_manager import db
-from utils.file_handler import delete_physical_file
+from services.blob_service import BlobService
+from services.upload_service import UploadService
+from services.processing_service import processing_service
+from services.lease_service import LeaseService
+from services.quota_service import quota_service
+from utils.metrics import Timer, CLEANUP_DURATION
 
 
 class CleanupService:
-    """定时清理服务"""
+    """定时清理服务
+
+    每个进程都运行调度器，但清理任务只在持有数据库租约的进程中执行；
+    各进程定期续约或尝试获取租约，持有者退出或失联后由其他进程接手。
+    重新提交待处理文件只涉及本进程的处理队列，不受租约限制。
+    """
 
     def __init__(self):
+        self.blob_service = BlobService()
+        self.upload_service = UploadService()
+        self.lease = LeaseService('cleanup')
         self.scheduler = BackgroundScheduler()
         self.setup_jobs()
-        self.scheduler.start()
+
+    def start(self):
+        """启动调度器"""
+        if not self.scheduler.running:
+            self.scheduler.start()
+            print("[清理服务] 定时任务已启动")
 
     def setup_jobs(self):
         """设置定时任务"""
-        # 每10分钟清理一次过期文件
+        # 定期续约（启动时立即尝试获取租约）
         self.scheduler.add_job(
-            self.cleanup_expired_files,
+            self.renew_lease,
             'interval',
-            minutes=config.CLEANUP_INTERVAL_MINUTES,
-            id='cleanup_files'
+            seconds=config.LEASE_RENEW_SECONDS,
+            next_run_time=datetime.now(),
+            id='renew_lease'
         )
 
+        # 每10分钟清理一次过期文件
+        self._add_leader_job(self.cleanup_expired_files, 'cleanup_files', minutes=config.CLEANUP_INTERVAL_MINUTES)
+
         # 每10分钟清理一次过期空间
+        self._add_leader_job(self.cleanup_expired_spaces, 'cleanup_spaces', minutes=config.CLEANUP_INTERVAL_MINUTES)
+
+        # 每10分钟清理一次过期的分片上传会话
+        self._add_leader_job(self.cleanup_expired_uploads, 'cleanup_uploads', minutes=config.CLEANUP_INTERVAL_MINUTES)
+
+        # 每小时物理删除超过保留期的已删除记录
+        self._add_leader_job(self.purge_deleted_rows, 'purge_deleted_rows', hours=1)
+
+        # 每小时检查一次，在空闲时段整理数据库
+        self._add_leader_job(self.maintain_database, 'maintain_database', hours=1)
+
+        # 每分钟将积压的待处理文件重新入队
         self.scheduler.add_job(
-            self.cleanup_expired_spaces,
+            self.requeue_pending_files,
             'interval',
-            minutes=config.CLEANUP_INTERVAL_MINUTES,
-            id='cleanup_spaces'
+            minutes=1,
+            id='requeue_pending_files'
         )
 
         # 每天清理一次过期的认证令牌
-        self.scheduler.add_job(
-            self.cleanup_expired_tokens,
-            'interval',
-            hours=24,
-            id='cleanup_tokens'
-        )
+        self._add_leader_job(self.cleanup_expired_tokens, 'cleanup_tokens', hours=24)
 
-    def cleanup_expired_files(self):
-        """清理过期文件"""
+    def _add_leader_job(self, func, job_id, **interval):
+        """添加只在租约持有者中执行的定时任务"""
+        self.scheduler.add_job(self._run_as_leader, 'interval', args=[func, job_id], id=job_id, **interval)
+
+    def _run_as_leader(self, func, job_id):
+        """持有租约时执行任务（记录耗时），否则跳过"""
+        if self.lease.is_held():
+            with Timer(CLEANUP_DURATION, job_id):
+                func()
+
+    def renew_lease(self):
+        """续约或尝试获取租约"""
+        was_leader = self.lease.is_held()
         try:
-            now = datetime.now()
+            is_leader = self.lease.acquire()
+        except Exception as e:
+            print(f"[清理服务] 续约失败: {e}")
+            is_leader = False
 
-            # 查询过期文件
-            expired_files = db.query(
-                "SELECT * FROM files WHERE expires_at < ? AND is_deleted = 0",
-                (now,)
-            )
+        if is_leader and not was_leader:
+            print(f"[清理服务] 获得清理任务租约（{self.lease.holder}）")
+        elif was_leader and not is_leader:
+            print(f"[清理服务] 失去清理任务租约（{self.lease.holder}）")
 
-            count = 0
-            for file in expired_files:
-                # 删除物理文件
-                if file['file_path']:
-                    delete_physical_file(file['file_path'])
-
-                # 标记为已删除
-                db.execute(
-                    "UPDATE files SET is_deleted = 1 WHERE id = ?",
-                    (file['id'],)
-                )
-                count += 1
+    def cleanup_expired_files(self):
+        """清理过期文件"""
+        try:
+            start = time.monotonic()
+            count = self._delete_files("expires_at < ?", (datetime.now(),))
+            elapsed = time.monotonic() - start
 
-            if count > 0:
-                print(f"[清理服务] 清理了 {count} 个过期文件")
+            print(f"[清理服务] 清理了 {count} 个过期文件，耗时 {elapsed:.3f} 秒")
 
         except Exception as e:
             print(f"[清理服务] 清理过期文件失败: {e}")
@@ -72,45 +110,184 @@ class CleanupService:
     def cleanup_expired_spaces(self):
         """清理过期空间"""
         try:
+            start = time.monotonic()
             now = datetime.now()
+            batch_size = config.CLEANUP_BATCH_SIZE
 
-            # 查询过期空间
-            expired_spaces = db.query(
-                "SELECT * FROM spaces WHERE expires_at < ? AND is_deleted = 0",
-                (now,)
+            count = 0
+            while True:
+                # 分批标记过期空间为已删除
+                with db.transaction() as conn:
+                    space_ids = [row['id'] for row in conn.execute(
+                        "SELECT id FROM spaces WHERE expires_at < ? AND is_deleted = 0 LIMIT ?",
+                        (now, batch_size)
+                    )]
+                    if space_ids:
+                        placeholders = ','.join('?' * len(space_ids))
+                        conn.execute(
+                            f"UPDATE spaces SET is_deleted = 1, deleted_at = ? WHERE id IN ({placeholders})",
+                            [now] + space_ids
+                        )
+
+                if not space_ids:
+                    break
+
+                # 再分批删除这些空间内的文件
+                placeholders = ','.join('?' * len(space_ids))
+                self._delete_files(f"space_id IN ({placeholders})", tuple(space_ids))
+                count += len(space_ids)
+
+                if len(space_ids) < batch_size:
+                    break
+
+            elapsed = time.monotonic() - start
+            print(f"[清理服务] 清理了 {count} 个过期空间，耗时 {elapsed:.3f} 秒")
+
+        except Exception as e:
+            print(f"[清理服务] 清理过期空间失败: {e}")
+
+    def _delete_files(self, condition, params):
+        """分批将满足条件的未删除文件标记为已删除，返回处理数量
+
+        每批只查询id和路径，用一条UPDATE在一个事务内完成标记，
+        事务提交后再删除物理文件，避免在持有写锁时做磁盘IO。
+        """
+        batch_size = config.CLEANUP_BATCH_SIZE
+
+        count = 0
+        while True:
+            with db.transaction() as conn:
+                files = conn.execute(
+                    f"""SELECT id, space_id, file_size, file_path, content_hash FROM files
+                        WHERE {condition} AND is_deleted = 0 LIMIT ?""",
+                    params + (batch_size,)
+                ).fetchall()
+                if files:
+                    placeholders = ','.join('?' * len(files))
+                    conn.execute(
+                        f"UPDATE files SET is_deleted = 1, deleted_at = ? WHERE id IN ({placeholders})",
+                        [datetime.now()] + [file['id'] for file in files]
+                    )
+                    paths, content_hashes = self.blob_service.release_files(conn, files)
+                    quota_service.release(conn, files)
+
+            if not files:
+                break
+
+            self.blob_service.delete_released(paths, content_hashes)
+            count += len(files)
+
+            if len(files) < batch_size:
+                break
+
+        return count
+
+    def purge_deleted_rows(self):
+        """物理删除超过保留期的已删除记录（文件、空间及其访问记录）"""
+        try:
+            start = time.monotonic()
+            cutoff = datetime.now() - timedelta(days=config.PURGE_RETENTION_DAYS)
+
+            # 没有删除时间的旧记录按过期时间计算
+            file_count = self._purge_in_batches(
+                """SELECT id FROM files WHERE is_deleted = 1
+                   AND (deleted_at < ? OR (deleted_at IS NULL AND expires_at < ?)) LIMIT ?""",
+                (cutoff, cutoff),
+                ["DELETE FROM files WHERE id IN ({})"]
             )
 
-            count = 0
-            for space in expired_spaces:
-                # 查询空间内的所有文件
-                files = db.query(
-                    "SELECT * FROM files WHERE space_id = ? AND is_deleted = 0",
-                    (space['id'],)
-                )
-
-                # 删除空间内的所有物理文件
-                for file in files:
-                    if file['file_path']:
-                        delete_physical_file(file['file_path'])
-
-                # 标记空间内所有文件为已删除
-                db.execute(
-                    "UPDATE files SET is_deleted = 1 WHERE space_id = ?",
-                    (space['id'],)
-                )
-
-                # 标记空间为已删除
-                db.execute(
-                    "UPDATE spaces SET is_deleted = 1 WHERE id = ?",
-                    (space['id'],)
-                )
-                count += 1
+            # 空间内仍有未删除的文件时暂不清除，等文件清理后再处理
+            space_count = self._purge_in_batches(
+                """SELECT id FROM spaces WHERE is_deleted = 1
+                   AND (deleted_at < ? OR (deleted_at IS NULL AND expires_at < ?))
+                   AND NOT EXISTS (SELECT 1 FROM files WHERE files.space_id = spaces.id AND files.is_deleted = 0)
+                   LIMIT ?""",
+                (cutoff, cutoff),
+                [
+                    "DELETE FROM space_access WHERE space_id IN ({})",
+                    "DELETE FROM files WHERE space_id IN ({})",
+                    "DELETE FROM spaces WHERE id IN ({})"
+                ]
+            )
+
+            elapsed = time.monotonic() - start
+            if file_count > 0 or space_count > 0:
+                print(f"[清理服务] 物理删除了 {file_count} 个文件记录、{space_count} 个空间记录，耗时 {elapsed:.3f} 秒")
+
+        except Exception as e:
+            print(f"[清理服务] 物理删除记录失败: {e}")
+
+    def _purge_in_batches(self, select_sql, params, delete_sqls):
+        """按小批量查询id并执行删除，每批一个事务，批次之间稍作停顿让出写锁"""
+        batch_size = config.PURGE_BATCH_SIZE
+
+        count = 0
+        while True:
+            with db.transaction() as conn:
+                ids = [row['id'] for row in conn.execute(select_sql, params + (batch_size,))]
+                if ids:
+                    placeholders = ','.join('?' * len(ids))
+                    for delete_sql in delete_sqls:
+                        conn.execute(delete_sql.format(placeholders), ids)
+
+            count += len(ids)
+            if len(ids) < batch_size:
+                return count
+            time.sleep(0.05)
+
+    def maintain_database(self, force=False):
+        """在空闲时段整理数据库：增量回收空闲页，更新查询优化器的统计信息（force为True时不检查时段）"""
+        start_hour, end_hour = config.MAINTENANCE_QUIET_HOURS
+        if not force and not start_hour <= datetime.now().hour < end_hour:
+            return
+
+        try:
+            start = time.monotonic()
+            with db.get_connection() as conn:
+                if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                    # 旧数据库切换为增量回收模式，需要完整VACUUM一次
+                    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    conn.execute("VACUUM")
+                else:
+                    # 分步回收，每步之后停顿，避免长时间占用写锁
+                    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                    while freelist > 0:
+                        conn.execute(f"PRAGMA incremental_vacuum({int(config.VACUUM_PAGES_PER_STEP)})").fetchall()
+                        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                        if remaining >= freelist:
+                            break
+                        freelist = remaining
+                        time.sleep(0.05)
+
+                conn.execute("ANALYZE")
+
+            elapsed = time.monotonic() - start
+            print(f"[清理服务] 数据库整理完成，耗时 {elapsed:.3f} 秒")
+
+        except Exception as e:
+            print(f"[清理服务] 数据库整理失败: {e}")
+
+    def cleanup_expired_uploads(self):
+        """清理过期（被放弃）的分片上传会话"""
+        try:
+            count = self.upload_service.cleanup_expired_sessions()
 
             if count > 0:
-                print(f"[清理服务] 清理了 {count} 个过期空间")
+                print(f"[清理服务] 清理了 {count} 个过期上传会话")
 
         except Exception as e:
-            print(f"[清理服务] 清理过期空间失败: {e}")
+            print(f"[清理服务] 清理过期上传会话失败: {e}")
+
+    def requeue_pending_files(self):
+        """将队列满时未能入队的文件重新提交后台处理"""
+        try:
+            count = processing_service.requeue_pending()
+
+            if count > 0:
+                print(f"[清理服务] 重新提交了 {count} 个待处理文件")
+
+        except Exception as e:
+            print(f"[清理服务] 重新提交待处理文件失败: {e}")
 
     def cleanup_expired_tokens(self):
         """清理过期的认证令牌"""
@@ -123,11 +300,50 @@ class CleanupService:
                 (now,)
             )
 
+            # 令牌已失效的空间访问记录不再需要
+            db.execute(
+                """DELETE FROM space_access
+                   WHERE NOT EXISTS (SELECT 1 FROM auth_tokens WHERE auth_tokens.token = space_access.token)"""
+            )
+
             print(f"[清理服务] 清理了过期的认证令牌")
 
         except Exception as e:
             print(f"[清理服务] 清理过期令牌失败: {e}")
 
     def shutdown(self):
-        """关闭调度器"""
-        self.scheduler.shutdown()
+        """关闭调度器（等待正在执行的任务完成），并释放租约以便其他进程立即接手"""
+        if self.scheduler.running:
+            self.scheduler.shutdown()
+        if self.lease.is_held():
+            self.lease.release()
+
+
+if __name__ == '__main__':
+    # 手动执行一次清理任务：python -m services.cleanup_service <任务名>
+    jobs = {
+        'cleanup_files': lambda service: service.cleanup_expired_files(),
+        'cleanup_spaces': lambda service: service.cleanup_expired_spaces(),
+        'cleanup_uploads': lambda service: service.cleanup_expired_uploads(),
+        'cleanup_tokens': lambda service: service.cleanup_expired_tokens(),
+        'purge_deleted_rows': lambda service: service.purge_deleted_rows(),
+        'maintain_database': lambda service: service.maintain_database(force=True),
+    }
+
+    parser = argparse.ArgumentParser(description='手动执行清理任务')
+    parser.add_argument('jobs', nargs='+', choices=sorted(jobs) + ['all'], help='要执行的任务')
+    parser.add_argument('--force', action='store_true', help='不获取租约，直接执行（可能与运行中的服务同时清理）')
+    args = parser.parse_args()
+
+    service = CleanupService()
+    if not args.force and not service.lease.acquire():
+        print(f"[清理服务] 清理任务租约由 {service.lease.get_holder()} 持有，稍后重试或使用 --force")
+        sys.exit(1)
+
+    try:
+        names = sorted(jobs) if 'all' in args.jobs else args.jobs
+        for name in names:
+            jobs[name](service)
+    finally:
+        if not args.force:
+            service.lease.release()
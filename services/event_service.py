@@ -0,0 +1,149 @@
+import json
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+import config
+
+
+class Subscription:
+    """单个事件订阅（对应一个SSE连接）"""
+
+    def __init__(self, space_id):
+        self.space_id = space_id
+        self.queue = queue.Queue(maxsize=config.EVENT_QUEUE_SIZE)
+        # 客户端消费过慢导致队列溢出，或服务正在关闭时置为True，
+        # 连接应随即断开，客户端凭Last-Event-ID重连补发
+        self.closed = False
+
+    def get(self, timeout):
+        """等待下一个事件，超时返回None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _SpaceChannel:
+    """单个空间的订阅者和最近事件"""
+
+    def __init__(self, dropped_through):
+        self.events = deque()
+        self.subscribers = set()
+        # 已从缓冲区淘汰的最大事件ID，早于它的Last-Event-ID无法补发
+        self.dropped_through = dropped_through
+
+
+class EventService:
+    """空间变更事件的进程内发布/订阅
+
+    每个空间保留最近若干条事件，客户端断线重连时按Last-Event-ID补发错过的事件；
+    错过的事件已被淘汰（或服务重启过）时补发一条reset事件，客户端重新加载列表。
+    事件ID从启动时的毫秒时间戳开始递增，重启后旧ID必然小于新ID。
+    多进程部署时只能收到同一进程内发布的事件。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = OrderedDict()
+        self._subscriber_count = 0
+        self._last_id = int(time.time() * 1000)
+        # 启动前的事件以及被整体淘汰的空间事件都视为无法补发
+        self._evicted_through = self._last_id
+
+    def publish(self, space_id, event_type, data):
+        """发布事件，返回事件ID"""
+        with self._lock:
+            self._last_id += 1
+            event = {'id': self._last_id, 'type': event_type, 'data': data}
+
+            channel = self._get_channel(space_id)
+            channel.events.append(event)
+            while len(channel.events) > config.EVENT_BUFFER_SIZE:
+                channel.dropped_through = channel.events.popleft()['id']
+
+            for subscription in channel.subscribers:
+                if subscription.closed:
+                    continue
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    subscription.closed = True
+
+            return event['id']
+
+    def subscribe(self, space_id, last_event_id=None):
+        """订阅空间事件，返回(订阅, 需要补发的事件列表)，连接数已达EVENT_MAX_SUBSCRIBERS时返回(None, [])"""
+        subscription = Subscription(space_id)
+        with self._lock:
+            if self._subscriber_count >= config.EVENT_MAX_SUBSCRIBERS:
+                return None, []
+            self._subscriber_count += 1
+
+            channel = self._get_channel(space_id)
+            channel.subscribers.add(subscription)
+
+            if last_event_id is None:
+                return subscription, []
+
+            if last_event_id < channel.dropped_through or last_event_id > self._last_id:
+                return subscription, [{'id': self._last_id, 'type': 'reset', 'data': {}}]
+
+            return subscription, [event for event in channel.events if event['id'] > last_event_id]
+
+    def unsubscribe(self, subscription):
+        """取消订阅（可重复调用）"""
+        with self._lock:
+            channel = self._channels.get(subscription.space_id)
+            if channel and subscription in channel.subscribers:
+                channel.subscribers.discard(subscription)
+                self._subscriber_count -= 1
+
+    def close_all(self):
+        """关闭所有订阅（服务退出前调用，让事件流连接尽快结束）"""
+        with self._lock:
+            for channel in self._channels.values():
+                for subscription in channel.subscribers:
+                    subscription.closed = True
+                    # 唤醒等待中的连接；队列已满时连接会在取出事件后发现已关闭
+                    try:
+                        subscription.queue.put_nowait(None)
+                    except queue.Full:
+                        pass
+
+    def get_stats(self):
+        """获取订阅状态"""
+        with self._lock:
+            return {
+                'spaces': len(self._channels),
+                'subscribers': self._subscriber_count,
+                'max_subscribers': config.EVENT_MAX_SUBSCRIBERS,
+                'last_event_id': self._last_id
+            }
+
+    def _get_channel(self, space_id):
+        """获取空间频道（需持有锁），空间数超过上限时淘汰最久未使用且无人订阅的空间"""
+        channel = self._channels.get(space_id)
+        if channel is None:
+            channel = self._channels[space_id] = _SpaceChannel(self._evicted_through)
+            for key in list(self._channels):
+                if len(self._channels) <= config.EVENT_MAX_SPACES:
+                    break
+                old = self._channels[key]
+                if not old.subscribers and key != space_id:
+                    if old.events:
+                        self._evicted_through = max(self._evicted_through, old.events[-1]['id'])
+                    del self._channels[key]
+        self._channels.move_to_end(space_id)
+        return channel
+
+
+def format_sse(event):
+    """将事件格式化为SSE消息"""
+    return (f"id: {event['id']}\n"
+            f"event: {event['type']}\n"
+            f"data: {json.dumps(event['data'], ensure_ascii=False, default=str)}\n\n")
+
+
+# 全局事件服务实例
+event_service = EventService()
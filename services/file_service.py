@@ -1,9 +1,74 @@
-from datetime import datetime, timedelta
 import os
+import base64
+import functools
+import hashlib
+from datetime import datetime, timedelta
 import config
 from database.db_manager import db
-from utils.validators import validate_filename, sanitize_filename, is_image_file, validate_file_size
-from utils.file_handler import generate_stored_filename, get_upload_path, delete_physical_file, get_mime_type
+from utils.validators import validate_filename, sanitize_filename, is_image_file, is_text_file
+from utils.file_handler import (generate_stored_filename, get_upload_path, get_mime_type, save_stream,
+                                decode_text_head, get_thumbnail, delete_physical_file)
+from services.blob_service import BlobService
+from services.processing_service import processing_service
+from services.event_service import event_service
+from services.quota_service import quota_service
+from services.search_service import search_service
+from utils.compression import encode_text, decode_text
+
+blob_service = BlobService()
+
+# 文件列表返回的字段（不包含文本内容，完整内容通过 /api/files/<id> 获取）
+LIST_COLUMNS = """id, space_id, filename, file_type, mime_type, file_size, preview_text,
+                  processing_status, created_at, updated_at, expires_at"""
+
+
+def encode_cursor(file):
+    """根据文件记录生成分页游标"""
+    raw = f"{file['created_at']}|{file['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析分页游标，返回(created_at, id)，不合法时返回None"""
+    try:
+        created_at, file_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return created_at, int(file_id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def apply_text_patch(text, ops):
+    """将补丁应用到文本，返回新文本，补丁不合法时抛出ValueError
+
+    ops为[{'pos': 位置, 'delete': 删除长度, 'insert': 插入文本}, ...]，
+    位置和长度都相对于修改前的文本、以UTF-16码元计（与JavaScript字符串下标一致），
+    各项按位置递增且互不重叠。
+    """
+    if not isinstance(ops, list) or not 0 < len(ops) <= config.TEXT_PATCH_MAX_OPS:
+        raise ValueError('补丁为空或过长')
+
+    units = text.encode('utf-16-le')
+    parts = []
+    offset = 0
+    for op in ops:
+        if not isinstance(op, dict):
+            raise ValueError('补丁项格式错误')
+        pos, delete, insert = op.get('pos'), op.get('delete', 0), op.get('insert', '')
+        if (not isinstance(pos, int) or not isinstance(delete, int) or not isinstance(insert, str)
+                or isinstance(pos, bool) or isinstance(delete, bool)):
+            raise ValueError('补丁项格式错误')
+        if pos < offset or delete < 0 or (pos + delete) * 2 > len(units):
+            raise ValueError('补丁位置超出范围或重叠')
+
+        parts.append(units[offset * 2:pos * 2])
+        parts.append(insert.encode('utf-16-le', 'surrogatepass'))
+        offset = pos + delete
+    parts.append(units[offset * 2:])
+
+    try:
+        return b''.join(parts).decode('utf-16-le')
+    except UnicodeDecodeError:
+        raise ValueError('补丁位置拆分了字符')
 
 
 class FileService:
@@ -14,71 +79,162 @@ class FileService:
         preview_text = content[:100] + '...' if len(content) > 100 else content
         expires_at = datetime.now() + timedelta(hours=config.FILE_EXPIRES_HOURS)
 
-        file_id = db.execute(
-            """INSERT INTO files (space_id, file_type, content, preview_text, expires_at)
-               VALUES (?, ?, ?, ?, ?)""",
-            (space_id, 'text', content, preview_text, expires_at)
-        )
+        data = content.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+
+        stored, encoding = encode_text(content)
+
+        with db.transaction() as conn:
+            error = quota_service.reserve(conn, space_id, len(data))
+            if error:
+                return {'success': False, 'message': error}
+
+            cursor = conn.execute(
+                """INSERT INTO files (space_id, file_type, content, content_encoding, content_hash, file_size,
+                                      preview_text, expires_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (space_id, 'text', stored, encoding, content_hash, len(data), preview_text, expires_at)
+            )
+            search_service.index(conn, cursor.lastrowid, None, content)
+        file_id = cursor.lastrowid
+        self._publish_created(file_id)
 
         return {'success': True, 'file_id': file_id}
 
     def upload_file(self, space_id, file):
-        """上传文件"""
+        """上传文件（multipart表单）"""
+        return self.upload_stream(space_id, file.filename, file.stream)
+
+    def upload_stream(self, space_id, filename, stream):
+        """流式上传文件
+
+        数据分块直接写入最终存储位置，写入的同时校验大小、计算哈希，
+        并保留开头部分用于生成预览；文本的完整内容由后台处理服务读取。
+        """
         # 验证文件名
-        if not validate_filename(file.filename):
+        if not validate_filename(filename):
             return {'success': False, 'message': '文件名不合法'}
 
-        # 验证文件大小
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
+        # 生成存储文件名
+        original_filename = sanitize_filename(filename)
+        stored_filename = generate_stored_filename(original_filename)
 
-        if not validate_file_size(file_size):
+        # 保存文件（边写边校验大小），写完后再按内容哈希归入去重存储
+        temp_path = get_upload_path(stored_filename)
+        saved = save_stream(stream, temp_path, config.MAX_FILE_SIZE)
+        if saved is None:
             return {'success': False, 'message': '文件大小超过20MB限制'}
+        file_size, content_hash, head = saved
 
-        # 生成存储文件名
-        original_filename = sanitize_filename(file.filename)
-        stored_filename = generate_stored_filename(original_filename)
+        return self.save_file_record(space_id, original_filename, stored_filename, temp_path,
+                                     file_size, content_hash, head)
 
+    def save_file_record(self, space_id, original_filename, stored_filename, temp_path,
+                         file_size, content_hash, head=b''):
+        """将已写入磁盘的文件归入去重存储并写入数据库记录
+
+        head为文件开头部分，用于立即生成文本预览；文本全文读取、图片识别等
+        较慢的处理交给后台处理服务，记录的processing_status为pending。
+        超出存储配额时删除已写入的文件并返回失败。
+        """
         # 确定文件类型
-        from utils.validators import is_text_file
         file_type = 'image' if is_image_file(original_filename) else 'file'
         mime_type = get_mime_type(original_filename)
+        is_text = is_text_file(original_filename)
 
-        # 保存文件
-        file_path = get_upload_path(stored_filename)
-        file.save(file_path)
-
-        # 如果是文本文件，读取内容用于预览
-        content = None
+        # 如果是文本文件，用开头部分生成预览
         preview_text = None
-        if is_text_file(original_filename):
-            from utils.file_handler import read_text_file
-            content = read_text_file(file_path)
-            if content:
-                preview_text = content[:100] + '...' if len(content) > 100 else content
+        if is_text and head:
+            preview_text = decode_text_head(head)
+            if preview_text and len(preview_text) > 100:
+                preview_text = preview_text[:100] + '...'
 
-        # 存入数据库
+        processing_status = 'pending' if is_text or file_type == 'image' else 'ready'
+
+        # 存入数据库（引用计数与文件记录在同一事务中）
         expires_at = datetime.now() + timedelta(hours=config.FILE_EXPIRES_HOURS)
-        file_id = db.execute(
-            """INSERT INTO files (space_id, filename, stored_filename, file_type, mime_type,
-                                  file_size, file_path, content, preview_text, expires_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (space_id, original_filename, stored_filename, file_type, mime_type,
-             file_size, file_path, content, preview_text, expires_at)
-        )
+        with db.transaction() as conn:
+            error = quota_service.reserve(conn, space_id, file_size)
+            if error is None:
+                file_path = blob_service.store(conn, temp_path, content_hash, file_size)
+                cursor = conn.execute(
+                    """INSERT INTO files (space_id, filename, stored_filename, file_type, mime_type,
+                                          file_size, content_hash, file_path, preview_text,
+                                          processing_status, expires_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (space_id, original_filename, stored_filename, file_type, mime_type,
+                     file_size, content_hash, file_path, preview_text, processing_status, expires_at)
+                )
+                # 文本文件的内容由后台处理服务读取后写入索引
+                search_service.index(conn, cursor.lastrowid, original_filename)
+        if error:
+            delete_physical_file(temp_path)
+            return {'success': False, 'message': error}
+
+        file_id = cursor.lastrowid
+        self._publish_created(file_id)
+
+        # 队列已满时保持pending，由定时任务补充入队
+        if processing_status == 'pending':
+            processing_service.submit(file_id)
 
         return {'success': True, 'file_id': file_id}
 
-    def get_files_by_space(self, space_id):
-        """获取空间内的所有文件"""
+    def list_files(self, space_id, limit=None, cursor=None, since=None):
+        """分页获取空间内的文件列表（按(created_at, id)翻页）
+
+        默认从最新的文件开始倒序返回，cursor为上一页返回的next_cursor；
+        传入since时只返回比该游标更新的文件（正序），用于增量刷新，此时next_cursor为空，
+        has_more为真表示还有更新的文件，应以返回的latest_cursor作为since继续获取。
+        """
+        limit = max(1, min(limit or config.FILE_LIST_PAGE_SIZE, config.FILE_LIST_MAX_PAGE_SIZE))
+
+        position = decode_cursor(since or cursor) if (since or cursor) else None
+        if (since or cursor) and position is None:
+            return {'success': False, 'message': '游标不合法'}
+
+        conditions = "space_id = ? AND is_deleted = 0 AND expires_at > ?"
+        params = (space_id, datetime.now())
+        if since:
+            conditions += " AND (created_at, id) > (?, ?)"
+            order = "created_at ASC, id ASC"
+            params += position
+        elif cursor:
+            conditions += " AND (created_at, id) < (?, ?)"
+            order = "created_at DESC, id DESC"
+            params += position
+        else:
+            order = "created_at DESC, id DESC"
+
         files = db.query(
-            """SELECT * FROM files
-               WHERE space_id = ? AND is_deleted = 0 AND expires_at > ?
-               ORDER BY created_at DESC""",
-            (space_id, datetime.now())
+            f"SELECT {LIST_COLUMNS} FROM files WHERE {conditions} ORDER BY {order} LIMIT ?",
+            params + (limit,)
         )
-        return files
+
+        has_more = len(files) == limit
+        # next_cursor只用于向更早的文件翻页（since模式为正序，末尾是最新的文件，不能作为cursor）
+        next_cursor = encode_cursor(files[-1]) if has_more and not since else None
+        # 最新文件的游标，用于下次增量刷新
+        if since:
+            latest_cursor = encode_cursor(files[-1]) if files else since
+        elif not cursor:
+            latest_cursor = encode_cursor(files[0]) if files else None
+        else:
+            latest_cursor = None
+
+        return {
+            'success': True,
+            'files': files,
+            'next_cursor': next_cursor,
+            'latest_cursor': latest_cursor,
+            'has_more': has_more
+        }
+
+    def _publish_created(self, file_id):
+        """发布文件创建事件（数据与文件列表中的一项相同）"""
+        file = db.query_one(f"SELECT {LIST_COLUMNS} FROM files WHERE id = ?", (file_id,))
+        if file:
+            event_service.publish(file['space_id'], 'created', file)
 
     def get_file_by_id(self, file_id):
         """根据ID获取文件"""
@@ -89,36 +245,86 @@ class FileService:
         )
         return file
 
-    def update_text_content(self, file_id, content):
-        """更新文本内容"""
-        file = self.get_file_by_id(file_id)
-        if not file or file['file_type'] != 'text':
-            return {'success': False, 'message': '文件不存在或不是文本类型'}
+    def update_text_content(self, file, content, base_version=None):
+        """用完整内容更新文本（file为已查询的文件记录）
 
-        preview_text = content[:100] + '...' if len(content) > 100 else content
+        指定base_version时只有当前版本与之相同才会更新，否则返回冲突。
+        """
+        return self._update_text(file, base_version, content=content)
 
-        db.execute(
-            "UPDATE files SET content = ?, preview_text = ? WHERE id = ?",
-            (content, preview_text, file_id)
-        )
+    def patch_text_content(self, file, base_version, ops):
+        """按补丁更新文本（见apply_text_patch），当前版本与base_version不同时返回冲突"""
+        return self._update_text(file, base_version, ops=ops)
 
-        return {'success': True}
+    def _update_text(self, file, base_version, content=None, ops=None):
+        """更新文本内容并将版本号加一
 
-    def delete_file(self, file_id):
-        """删除文件"""
-        file = self.get_file_by_id(file_id)
-        if not file:
-            return {'success': False, 'message': '文件不存在'}
+        在写事务内重新读取当前版本和内容，检查版本与应用补丁都基于最新数据，
+        并发的修改中只有一个能成功，其余收到冲突（conflict）和当前版本号。
+        """
+        file_id = file['id']
+        if file['file_type'] != 'text':
+            return {'success': False, 'message': '文件不存在或不是文本类型'}
 
-        # 如果是物理文件，删除物理文件
-        if file['file_path']:
-            delete_physical_file(file['file_path'])
-
-        # 标记为已删除
-        db.execute(
-            "UPDATE files SET is_deleted = 1 WHERE id = ?",
-            (file_id,)
-        )
+        with db.transaction() as conn:
+            current = conn.execute(
+                "SELECT content, content_encoding, file_size, version FROM files WHERE id = ? AND is_deleted = 0",
+                (file_id,)
+            ).fetchone()
+            if current is None:
+                return {'success': False, 'message': '文件不存在或不是文本类型'}
+
+            if base_version is not None and current['version'] != base_version:
+                return {'success': False, 'conflict': True, 'version': current['version'],
+                        'message': '内容已被其他人修改，请刷新后重试'}
+
+            if ops is not None:
+                try:
+                    content = apply_text_patch(decode_text(current['content'], current['content_encoding']), ops)
+                except ValueError as e:
+                    return {'success': False, 'message': f'补丁不合法：{e}'}
+
+            preview_text = content[:100] + '...' if len(content) > 100 else content
+            data = content.encode('utf-8')
+            content_hash = hashlib.sha256(data).hexdigest()
+
+            # 按修改前后的字节数之差调整用量
+            error = quota_service.reserve(conn, file['space_id'], len(data) - (current['file_size'] or 0), count=0)
+            if error:
+                return {'success': False, 'message': error}
+
+            stored, encoding = encode_text(content)
+            version = current['version'] + 1
+            conn.execute(
+                """UPDATE files SET content = ?, content_encoding = ?, content_hash = ?, file_size = ?,
+                                    preview_text = ?, version = ?, updated_at = CURRENT_TIMESTAMP
+                   WHERE id = ?""",
+                (stored, encoding, content_hash, len(data), preview_text, version, file_id)
+            )
+            search_service.update_content(conn, file_id, content)
+        event_service.publish(file['space_id'], 'updated',
+                              {'id': file_id, 'preview_text': preview_text, 'version': version})
+
+        return {'success': True, 'version': version, 'content_hash': content_hash}
+
+    def delete_file(self, file):
+        """删除文件（file为已查询的文件记录）"""
+        file_id = file['id']
+
+        # 标记为已删除，并释放物理文件（同一内容的最后一个引用才会删除文件）
+        paths, content_hashes = [], []
+        with db.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE files SET is_deleted = 1, deleted_at = ? WHERE id = ? AND is_deleted = 0",
+                (datetime.now(), file_id)
+            )
+            if cursor.rowcount:
+                paths, content_hashes = blob_service.release_files(conn, [file])
+                quota_service.release(conn, [file])
+        blob_service.delete_released(paths, content_hashes)
+
+        if cursor.rowcount:
+            event_service.publish(file['space_id'], 'deleted', {'id': file_id})
 
         return {'success': True}
 
@@ -129,34 +335,155 @@ class FileService:
             return None
 
         if file['file_type'] == 'text':
-            return file['content'].encode('utf-8'), 'text/plain; charset=utf-8'
+            return self.get_text(file).encode('utf-8'), 'text/plain; charset=utf-8'
         else:
             return file['file_path'], file['mime_type']
 
-    def extend_file_expiry(self, file_id, hours=24):
-        """延长文件过期时间"""
-        file = self.get_file_by_id(file_id)
-        if not file:
-            return {'success': False, 'message': '文件不存在'}
+    def get_text(self, file):
+        """获取文件记录中的文本内容（压缩存储的内容在此时才解压）"""
+        return decode_text(file['content'], file['content_encoding'])
 
-        # 计算新的过期时间
-        current_expires = datetime.fromisoformat(file['expires_at']) if isinstance(file['expires_at'], str) else file['expires_at']
-        new_expires = current_expires + timedelta(hours=hours)
+    def _read_text_bytes(self, file_id):
+        """读取文本文件的内容（UTF-8编码），文件已删除时返回None"""
+        file = db.query_one(
+            "SELECT content, content_encoding FROM files WHERE id = ? AND is_deleted = 0",
+            (file_id,)
+        )
+        if file is None:
+            return None
+        return (self.get_text(file) or '').encode('utf-8')
 
-        # 检查是否超过最大延长时间（从创建时间算起最多7天）
-        created_at = datetime.fromisoformat(file['created_at']) if isinstance(file['created_at'], str) else file['created_at']
-        max_expires = created_at + timedelta(days=config.MAX_EXTEND_DAYS)
+    def get_thumbnail(self, file, size_name):
+        """获取图片缩略图路径，首次请求时生成；非图片或原图足够小时返回None"""
+        if file['file_type'] != 'image' or not file['file_path']:
+            return None
+        return get_thumbnail(file['file_path'], size_name)
 
-        if new_expires > max_expires:
-            new_expires = max_expires
+    def extend_file_expiry(self, file, hours=24):
+        """延长文件过期时间（file为已查询的文件记录）"""
+        file_id = file['id']
 
+        new_expires = self._extended_expiry(file, hours)
         # 如果已经达到最大时间，不能再延长
-        if current_expires >= max_expires:
+        if new_expires is None:
             return {'success': False, 'message': '已达到最大保留时间（7天）'}
 
         db.execute(
             "UPDATE files SET expires_at = ? WHERE id = ?",
             (new_expires, file_id)
         )
+        event_service.publish(file['space_id'], 'extended', {'id': file_id, 'expires_at': new_expires})
 
         return {'success': True, 'new_expires_at': new_expires.isoformat()}
+
+    def _extended_expiry(self, file, hours):
+        """计算延长后的过期时间，已达到最大保留时间时返回None"""
+        current_expires = datetime.fromisoformat(file['expires_at']) if isinstance(file['expires_at'], str) else file['expires_at']
+        new_expires = current_expires + timedelta(hours=hours)
+
+        # 检查是否超过最大延长时间（从创建时间算起最多7天）
+        created_at = datetime.fromisoformat(file['created_at']) if isinstance(file['created_at'], str) else file['created_at']
+        max_expires = created_at + timedelta(days=config.MAX_EXTEND_DAYS)
+
+        if current_expires >= max_expires:
+            return None
+        return min(new_expires, max_expires)
+
+    def delete_files(self, space_id, file_ids):
+        """批量删除空间内的文件（单个事务），返回已删除和不存在的文件ID"""
+        placeholders = ', '.join('?' * len(file_ids))
+        paths, content_hashes = [], []
+        with db.transaction() as conn:
+            files = conn.execute(
+                f"""SELECT id, space_id, file_size, file_path, content_hash FROM files
+                    WHERE space_id = ? AND id IN ({placeholders}) AND is_deleted = 0 AND expires_at > ?""",
+                (space_id, *file_ids, datetime.now())
+            ).fetchall()
+            deleted_ids = [file['id'] for file in files]
+            if deleted_ids:
+                conn.execute(
+                    f"UPDATE files SET is_deleted = 1, deleted_at = ? WHERE id IN ({', '.join('?' * len(deleted_ids))})",
+                    (datetime.now(), *deleted_ids)
+                )
+                paths, content_hashes = blob_service.release_files(conn, files)
+                quota_service.release(conn, files)
+        blob_service.delete_released(paths, content_hashes)
+
+        for file_id in deleted_ids:
+            event_service.publish(space_id, 'deleted', {'id': file_id})
+
+        found = set(deleted_ids)
+        return {
+            'success': True,
+            'deleted': deleted_ids,
+            'missing': [file_id for file_id in file_ids if file_id not in found]
+        }
+
+    def extend_files_expiry(self, space_id, file_ids, hours=24):
+        """批量延长空间内文件的过期时间（单个事务），已达到最大保留时间的文件跳过"""
+        placeholders = ', '.join('?' * len(file_ids))
+        extended = []
+        skipped = []
+        with db.transaction() as conn:
+            files = conn.execute(
+                f"""SELECT id, created_at, expires_at FROM files
+                    WHERE space_id = ? AND id IN ({placeholders}) AND is_deleted = 0 AND expires_at > ?""",
+                (space_id, *file_ids, datetime.now())
+            ).fetchall()
+            for file in files:
+                new_expires = self._extended_expiry(file, hours)
+                if new_expires is None:
+                    skipped.append(file['id'])
+                else:
+                    extended.append((file['id'], new_expires))
+            conn.executemany(
+                "UPDATE files SET expires_at = ? WHERE id = ?",
+                [(new_expires, file_id) for file_id, new_expires in extended]
+            )
+
+        for file_id, new_expires in extended:
+            event_service.publish(space_id, 'extended', {'id': file_id, 'expires_at': new_expires})
+
+        found = {file['id'] for file in files}
+        return {
+            'success': True,
+            'extended': [{'id': file_id, 'new_expires_at': new_expires.isoformat()}
+                         for file_id, new_expires in extended],
+            'skipped': skipped,
+            'missing': [file_id for file_id in file_ids if file_id not in found]
+        }
+
+    def get_archive_entries(self, space_id, file_ids=None):
+        """获取打包下载的条目（见stream_zip），file_ids为空时打包空间内全部文件"""
+        conditions = "space_id = ? AND is_deleted = 0 AND expires_at > ?"
+        params = (space_id, datetime.now())
+        if file_ids:
+            conditions += f" AND id IN ({', '.join('?' * len(file_ids))})"
+            params += tuple(file_ids)
+
+        files = db.query(
+            f"""SELECT id, filename, file_type, mime_type, file_path, created_at FROM files
+                WHERE {conditions} ORDER BY created_at, id""",
+            params
+        )
+
+        entries = []
+        used_names = set()
+        for file in files:
+            if file['file_type'] == 'text':
+                # 文本内容在写入压缩包时才逐个读取
+                name, source = f"text-{file['id']}.txt", functools.partial(self._read_text_bytes, file['id'])
+            else:
+                name, source = file['filename'] or f"file-{file['id']}", file['file_path']
+
+            # 同名文件加序号区分
+            base, ext = os.path.splitext(name)
+            index = 1
+            while name in used_names:
+                index += 1
+                name = f"{base} ({index}){ext}"
+            used_names.add(name)
+
+            compress = file['file_type'] == 'text' or (file['mime_type'] or '').startswith('text/')
+            entries.append((name, source, datetime.fromisoformat(file['created_at']), compress))
+        return entries
@@ -0,0 +1,66 @@
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+import config
+from database.db_manager import db
+
+
+class LeaseService:
+    """数据库租约
+
+    多个进程（或共享同一数据库的多个节点）竞争同一个租约，同一时间只有一个持有者。
+    持有者需要在租约到期前续约；持有者退出或卡住时租约过期，由其他进程接手。
+    """
+
+    def __init__(self, name, ttl=None):
+        self.name = name
+        self.ttl = ttl or config.LEASE_TTL_SECONDS
+        self._token = uuid.uuid4().hex[:8]
+        # 本地记录的租约有效期（单调时钟），提前一个续约间隔视为失效，留出切换余量
+        self._valid_until = 0
+
+    @property
+    def holder(self):
+        """持有者标识（包含进程号，fork后的子进程不会与父进程相同）"""
+        return f"{socket.gethostname()}:{os.getpid()}:{self._token}"
+
+    def acquire(self):
+        """获取或续约租约，成功返回True"""
+        started = time.monotonic()
+        now = datetime.now()
+        # 租约不存在、已过期或本来就由自己持有时才会写入
+        with db.transaction() as conn:
+            cursor = conn.execute(
+                """INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                   ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                   WHERE leases.holder = excluded.holder OR leases.expires_at < ?""",
+                (self.name, self.holder, now + timedelta(seconds=self.ttl), now)
+            )
+        if cursor.rowcount:
+            self._valid_until = started + self.ttl - config.LEASE_RENEW_SECONDS
+            return True
+
+        self._valid_until = 0
+        return False
+
+    def release(self):
+        """主动释放租约（仅释放自己持有的）"""
+        self._valid_until = 0
+        db.execute(
+            "DELETE FROM leases WHERE name = ? AND holder = ?",
+            (self.name, self.holder)
+        )
+
+    def is_held(self):
+        """当前进程是否持有有效租约"""
+        return time.monotonic() < self._valid_until
+
+    def get_holder(self):
+        """获取当前持有者（租约已过期时返回None）"""
+        lease = db.query_one(
+            "SELECT holder FROM leases WHERE name = ? AND expires_at > ?",
+            (self.name, datetime.now())
+        )
+        return lease['holder'] if lease else None
@@ -0,0 +1,162 @@
+import queue
+import threading
+from datetime import datetime, timedelta
+import config
+from database.db_manager import db
+from utils.validators import is_text_file
+from utils.file_handler import read_text_file, get_thumbnail
+from utils.compression import encode_text
+from services.event_service import event_service
+from services.search_service import search_service
+from PIL import Image
+
+
+class ProcessingService:
+    """上传后台处理服务
+
+    文本文件解码、图片格式识别和缩略图生成放到固定数量的后台线程中执行，
+    上传请求只负责写入文件和记录。队列有上限，队列满时不阻塞请求，
+    文件保持pending状态，由定时任务（requeue_pending）稍后补充入队。
+    后台线程随进程退出而中断，处理超时的文件同样由requeue_pending重置为pending。
+    """
+
+    def __init__(self, workers=None, queue_size=None):
+        self.workers = workers or config.PROCESSING_WORKERS
+        self._queue = queue.Queue(maxsize=queue_size or config.PROCESSING_QUEUE_SIZE)
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """启动后台线程（首次提交任务时自动调用）"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'processing-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, file_id):
+        """提交处理任务，队列已满时返回False"""
+        self.start()
+        with self._lock:
+            if file_id in self._queued:
+                return True
+            try:
+                self._queue.put_nowait(file_id)
+            except queue.Full:
+                return False
+            self._queued.add(file_id)
+        return True
+
+    def requeue_pending(self):
+        """将处理超时的文件重置为pending，并将pending状态的文件重新入队，返回入队数量"""
+        self.reset_stale()
+
+        free_slots = self._queue.maxsize - self._queue.qsize()
+        if free_slots <= 0:
+            return 0
+
+        pending = db.query(
+            """SELECT id FROM files WHERE processing_status = 'pending' AND is_deleted = 0
+               ORDER BY id LIMIT ?""",
+            (free_slots,)
+        )
+        return sum(1 for row in pending if self.submit(row['id']))
+
+    def reset_stale(self):
+        """将处理开始后超过PROCESSING_TIMEOUT_SECONDS仍未完成的文件重置为pending，返回重置数量"""
+        cutoff = datetime.now() - timedelta(seconds=config.PROCESSING_TIMEOUT_SECONDS)
+        with db.transaction() as conn:
+            cursor = conn.execute(
+                """UPDATE files SET processing_status = 'pending', processing_started_at = NULL
+                   WHERE processing_status = 'processing' AND is_deleted = 0
+                     AND (processing_started_at < ? OR processing_started_at IS NULL)""",
+                (cutoff,)
+            )
+        if cursor.rowcount:
+            print(f"[处理服务] {cursor.rowcount} 个文件处理超时，已重置为待处理")
+        return cursor.rowcount
+
+    def get_stats(self):
+        """获取队列状态"""
+        return {
+            'workers': self.workers,
+            'queued': self._queue.qsize(),
+            'queue_size': self._queue.maxsize
+        }
+
+    def _worker(self):
+        """后台线程：依次处理队列中的文件"""
+        while True:
+            file_id = self._queue.get()
+            with self._lock:
+                self._queued.discard(file_id)
+            try:
+                self.process_file(file_id)
+            except Exception as e:
+                print(f"[处理服务] 处理文件 {file_id} 失败: {e}")
+                db.execute(
+                    "UPDATE files SET processing_status = 'failed' WHERE id = ?",
+                    (file_id,)
+                )
+            finally:
+                self._queue.task_done()
+
+    def process_file(self, file_id):
+        """处理单个文件"""
+        # 认领任务，避免同一文件被重复处理
+        with db.transaction() as conn:
+            cursor = conn.execute(
+                """UPDATE files SET processing_status = 'processing', processing_started_at = ?
+                   WHERE id = ? AND processing_status = 'pending' AND is_deleted = 0""",
+                (datetime.now(), file_id)
+            )
+            if not cursor.rowcount:
+                return
+            file = dict(conn.execute(
+                "SELECT id, space_id, filename, file_type, file_size, file_path FROM files WHERE id = ?",
+                (file_id,)
+            ).fetchone())
+
+        content = None
+        preview_text = None
+        mime_type = None
+
+        if is_text_file(file['filename']) and file['file_size'] <= config.MAX_FILE_SIZE:
+            # 文本文件：读取全部内容（utf-8，失败时尝试gbk）
+            content = read_text_file(file['file_path'])
+            if content:
+                preview_text = content[:100] + '...' if len(content) > 100 else content
+
+        if file['file_type'] == 'image':
+            # 图片：按实际格式识别MIME类型，并预先生成小尺寸缩略图
+            with Image.open(file['file_path']) as image:
+                mime_type = Image.MIME.get(image.format)
+            get_thumbnail(file['file_path'], 'small')
+
+        stored, encoding = encode_text(content) if content else (None, None)
+        with db.transaction() as conn:
+            conn.execute(
+                """UPDATE files SET processing_status = 'ready',
+                                    content = COALESCE(?, content),
+                                    content_encoding = CASE WHEN ? IS NULL THEN content_encoding ELSE ? END,
+                                    preview_text = COALESCE(?, preview_text),
+                                    mime_type = COALESCE(?, mime_type)
+                   WHERE id = ?""",
+                (stored, stored, encoding, preview_text, mime_type, file_id)
+            )
+            if content:
+                search_service.update_content(conn, file_id, content)
+
+        updated = {'id': file_id, 'processing_status': 'ready'}
+        if preview_text is not None:
+            updated['preview_text'] = preview_text
+        if mime_type is not None:
+            updated['mime_type'] = mime_type
+        event_service.publish(file['space_id'], 'updated', updated)
+
+
+# 全局处理服务实例
+processing_service = ProcessingService()
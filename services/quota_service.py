@@ -0,0 +1,118 @@
+import config
+from database.db_manager import db
+
+
+class QuotaService:
+    """存储用量统计与配额
+
+    每个空间的字节数和文件数记录在spaces表，全站合计记录在storage_usage表（单行），
+    由文件的创建、修改、删除和过期清理在同一事务中增量维护，检查配额时无需聚合查询。
+    文本内容按UTF-8字节数计算；去重存储的文件按每条记录的大小分别计入。
+    计数相关方法都在调用方的事务中执行。
+    """
+
+    def reserve(self, conn, space_id, size, count=1):
+        """为即将写入的文件（或文本的增量）占用配额，超出配额时返回错误信息，成功返回None"""
+        space = conn.execute(
+            "SELECT used_bytes, file_count FROM spaces WHERE id = ? AND is_deleted = 0",
+            (space_id,)
+        ).fetchone()
+        if space is None:
+            return '空间不存在'
+
+        totals = conn.execute("SELECT used_bytes, file_count FROM storage_usage WHERE id = 1").fetchone()
+
+        # 只在用量增加时检查，配额调低后仍允许删除和缩减内容
+        if size > 0 or count > 0:
+            if not self._fits(space['used_bytes'] + size, config.SPACE_QUOTA_BYTES):
+                return '空间容量已满'
+            if not self._fits(space['file_count'] + count, config.SPACE_MAX_FILES):
+                return '空间文件数量已达上限'
+            if not self._fits(totals['used_bytes'] + size, config.STORAGE_QUOTA_BYTES):
+                return '服务器存储空间已满'
+            if not self._fits(totals['file_count'] + count, config.STORAGE_MAX_FILES):
+                return '服务器文件数量已达上限'
+
+        self._add(conn, space_id, size, count)
+        return None
+
+    def release(self, conn, files):
+        """释放一批文件记录占用的配额（记录需包含space_id和file_size）"""
+        released = {}
+        for file in files:
+            size, count = released.get(file['space_id'], (0, 0))
+            released[file['space_id']] = (size + (file['file_size'] or 0), count + 1)
+
+        for space_id, (size, count) in released.items():
+            self._add(conn, space_id, -size, -count)
+
+    def check(self, space_id, size, conn=None):
+        """上传前按已知大小预先检查配额（不占用），超出时返回错误信息
+
+        未完成的分片上传会话已预分配分片文件，按声明的大小和一个文件计入用量，
+        避免多个会话各自通过检查后写入的分片总量远超配额。
+        传入conn时在调用方的事务中检查（创建上传会话时与写入会话记录在同一事务中）。
+        """
+        if conn is None:
+            with db.get_connection() as conn:
+                return self._check(conn, space_id, size)
+        return self._check(conn, space_id, size)
+
+    def _check(self, conn, space_id, size):
+        space = conn.execute(
+            "SELECT used_bytes, file_count FROM spaces WHERE id = ? AND is_deleted = 0",
+            (space_id,)
+        ).fetchone()
+        if space is None:
+            return '空间不存在'
+        pending = conn.execute(
+            "SELECT COALESCE(SUM(file_size), 0) AS bytes, COUNT(*) AS count FROM upload_sessions WHERE space_id = ?",
+            (space_id,)
+        ).fetchone()
+
+        if not self._fits(space['used_bytes'] + pending['bytes'] + size, config.SPACE_QUOTA_BYTES):
+            return '空间容量已满'
+        if not self._fits(space['file_count'] + pending['count'] + 1, config.SPACE_MAX_FILES):
+            return '空间文件数量已达上限'
+
+        totals = conn.execute("SELECT used_bytes, file_count FROM storage_usage WHERE id = 1").fetchone()
+        pending = conn.execute(
+            "SELECT COALESCE(SUM(file_size), 0) AS bytes, COUNT(*) AS count FROM upload_sessions"
+        ).fetchone()
+        if not self._fits(totals['used_bytes'] + pending['bytes'] + size, config.STORAGE_QUOTA_BYTES):
+            return '服务器存储空间已满'
+        if not self._fits(totals['file_count'] + pending['count'] + 1, config.STORAGE_MAX_FILES):
+            return '服务器文件数量已达上限'
+        return None
+
+    def get_usage(self, space):
+        """获取空间用量和配额"""
+        return {
+            'used_bytes': space['used_bytes'],
+            'file_count': space['file_count'],
+            'quota_bytes': config.SPACE_QUOTA_BYTES,
+            'max_files': config.SPACE_MAX_FILES
+        }
+
+    def get_totals(self):
+        """获取全站用量"""
+        return db.query_one("SELECT used_bytes, file_count FROM storage_usage WHERE id = 1")
+
+    def _add(self, conn, space_id, size, count):
+        """累加空间和全站用量"""
+        conn.execute(
+            "UPDATE spaces SET used_bytes = used_bytes + ?, file_count = file_count + ? WHERE id = ?",
+            (size, count, space_id)
+        )
+        conn.execute(
+            "UPDATE storage_usage SET used_bytes = used_bytes + ?, file_count = file_count + ? WHERE id = 1",
+            (size, count)
+        )
+
+    @staticmethod
+    def _fits(value, limit):
+        return limit is None or value <= limit
+
+
+# 全局配额服务实例
+quota_service = QuotaService()
@@ -0,0 +1,143 @@
+import html
+import re
+from datetime import datetime
+import config
+from database.db_manager import db
+
+# 搜索结果返回的字段（与文件列表相同）
+RESULT_COLUMNS = """f.id, f.space_id, f.filename, f.file_type, f.mime_type, f.file_size, f.preview_text,
+                    f.processing_status, f.created_at, f.updated_at, f.expires_at"""
+
+# 摘要中匹配部分的起止标记（私有区字符，转义HTML后替换为<mark>）
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+
+# trigram分词下，MATCH只能检索不少于3个字符的词
+MIN_MATCH_CHARS = 3
+
+
+class SearchService:
+    """文件名和文本内容的全文搜索
+
+    索引为FTS5表files_fts（rowid即files.id，见数据库迁移8），只包含未删除的文件：
+    文件创建、文本修改和后台处理读出文本内容时由调用方在同一事务中写入，
+    标记删除和物理删除时由触发器移出。已过期但尚未清理的文件在查询时排除。
+    """
+
+    def index(self, conn, file_id, filename, content=None):
+        """将新文件写入索引"""
+        conn.execute(
+            "INSERT OR REPLACE INTO files_fts (rowid, filename, content) VALUES (?, ?, ?)",
+            (file_id, filename, self._index_value(content))
+        )
+
+    def update_content(self, conn, file_id, content):
+        """更新已索引文件的文本内容（文件已删除时不做任何事）"""
+        conn.execute(
+            "UPDATE files_fts SET content = ? WHERE rowid = ?",
+            (self._index_value(content), file_id)
+        )
+
+    def search(self, space_id, query, limit=None, offset=0):
+        """在空间内搜索，多个词（空格分隔）需同时匹配
+
+        返回的每一项在文件列表字段之外包含filename_highlight和snippet（已转义的HTML，
+        匹配部分用<mark>标出）。结果按相关度排序；含少于3个字符的词时无法使用索引，
+        改为在空间内逐个文件查找，按创建时间倒序排列。
+        """
+        query = (query or '').strip()
+        if not query or len(query) > config.SEARCH_MAX_QUERY_LENGTH:
+            return {'success': False, 'message': f'搜索词长度应为1到{config.SEARCH_MAX_QUERY_LENGTH}个字符'}
+
+        terms = list(dict.fromkeys(query.split()))
+        limit = max(1, min(limit or config.SEARCH_PAGE_SIZE, config.SEARCH_MAX_PAGE_SIZE))
+        offset = max(0, offset or 0)
+
+        # 多取一条判断是否还有下一页
+        if all(len(term) >= MIN_MATCH_CHARS for term in terms):
+            results = self._match(space_id, terms, limit + 1, offset)
+        else:
+            results = self._scan(space_id, terms, limit + 1, offset)
+
+        has_more = len(results) > limit
+        results = results[:limit]
+        for result in results:
+            result['filename_highlight'] = _render(result['filename_highlight'])
+            result['snippet'] = _render(result['snippet'])
+
+        return {
+            'success': True,
+            'results': results,
+            'next_offset': offset + limit if has_more else None
+        }
+
+    def _match(self, space_id, terms, limit, offset):
+        """通过全文索引查找，按bm25排序（文件名匹配的权重更高）"""
+        match = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+        return db.query(
+            f"""SELECT {RESULT_COLUMNS},
+                       highlight(files_fts, 0, ?, ?) AS filename_highlight,
+                       snippet(files_fts, 1, ?, ?, '…', ?) AS snippet
+                FROM files_fts JOIN files f ON f.id = files_fts.rowid
+                WHERE files_fts MATCH ? AND f.space_id = ? AND f.is_deleted = 0 AND f.expires_at > ?
+                ORDER BY bm25(files_fts, 5.0, 1.0), f.id DESC
+                LIMIT ? OFFSET ?""",
+            (MARK_START, MARK_END, MARK_START, MARK_END, config.SEARCH_SNIPPET_CHARS,
+             match, space_id, datetime.now(), limit, offset)
+        )
+
+    def _scan(self, space_id, terms, limit, offset):
+        """在空间内的文件中逐个查找（不区分ASCII大小写），摘要和高亮在Python中生成"""
+        conditions = ' AND '.join(
+            "(instr(lower(files_fts.filename), lower(?)) > 0 OR instr(lower(files_fts.content), lower(?)) > 0)"
+            for _ in terms
+        )
+        params = [value for term in terms for value in (term, term)]
+        rows = db.query(
+            f"""SELECT {RESULT_COLUMNS}, files_fts.filename AS indexed_filename, files_fts.content AS indexed_content
+                FROM files f JOIN files_fts ON files_fts.rowid = f.id
+                WHERE f.space_id = ? AND f.is_deleted = 0 AND f.expires_at > ? AND {conditions}
+                ORDER BY f.created_at DESC, f.id DESC
+                LIMIT ? OFFSET ?""",
+            (space_id, datetime.now(), *params, limit, offset)
+        )
+
+        pattern = re.compile('|'.join(re.escape(term) for term in sorted(terms, key=len, reverse=True)),
+                             re.IGNORECASE)
+        for row in rows:
+            filename = row.pop('indexed_filename')
+            content = row.pop('indexed_content')
+            row['filename_highlight'] = pattern.sub(_mark, filename) if filename is not None else None
+            row['snippet'] = _snippet(content, pattern) if content is not None else None
+        return rows
+
+    @staticmethod
+    def _index_value(content):
+        """写入索引的文本（过长时截断）"""
+        return content[:config.SEARCH_INDEX_MAX_CHARS] if content else None
+
+
+def _mark(match):
+    return MARK_START + match.group(0) + MARK_END
+
+
+def _snippet(content, pattern):
+    """截取第一个匹配附近的内容作为摘要（与FTS5的snippet格式相同）"""
+    size = config.SEARCH_SNIPPET_CHARS
+    found = pattern.search(content)
+    start = max(0, found.start() - size // 4) if found else 0
+    end = min(len(content), start + size)
+
+    text = pattern.sub(_mark, content[start:end])
+    return ('…' if start > 0 else '') + text + ('…' if end < len(content) else '')
+
+
+def _render(text):
+    """转义HTML并将匹配标记替换为<mark>"""
+    if text is None:
+        return None
+    return html.escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+# 全局搜索服务实例
+search_service = SearchService()
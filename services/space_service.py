@@ -1,7 +1,21 @@
+import sqlite3
 from datetime import datetime, timedelta
 import config
 from database.db_manager import db
-from utils.security import hash_password, verify_password
+from utils.security import hash_password, verify_password, password_fingerprint
+from services.blob_service import BlobService
+from services.event_service import event_service
+from services.quota_service import quota_service
+
+blob_service = BlobService()
+
+# 返回给客户端的空间字段（密码哈希和指纹只在服务端使用，不能返回）
+PUBLIC_SPACE_FIELDS = ('id', 'name', 'created_at', 'expires_at', 'used_bytes', 'file_count')
+
+
+def public_space(space):
+    """空间信息中可以返回给客户端的部分"""
+    return {field: space[field] for field in PUBLIC_SPACE_FIELDS}
 
 
 class SpaceService:
@@ -17,77 +31,130 @@ class SpaceService:
         if existing_name:
             return {'success': False, 'message': '空间名称已存在'}
 
-        # 生成密码哈希
+        # 生成密码哈希和指纹
         password_hash = hash_password(password)
+        fingerprint = password_fingerprint(password)
 
         # 检查密码是否已被使用（密码必须唯一）
-        existing_password = db.query_one(
-            "SELECT id FROM spaces WHERE password_hash = ? AND is_deleted = 0",
-            (password_hash,)
-        )
-        if existing_password:
+        if self._find_space_by_password(password, fingerprint, include_expired=True):
             return {'success': False, 'message': '该密码已被使用，请更换密码'}
 
         # 创建空间
         expires_at = datetime.now() + timedelta(hours=config.SPACE_EXPIRES_HOURS)
-        space_id = db.execute(
-            "INSERT INTO spaces (name, password_hash, expires_at) VALUES (?, ?, ?)",
-            (name, password_hash, expires_at)
-        )
+        try:
+            space_id = db.execute(
+                "INSERT INTO spaces (name, password_hash, password_fingerprint, expires_at) VALUES (?, ?, ?, ?)",
+                (name, password_hash, fingerprint, expires_at)
+            )
+        except sqlite3.IntegrityError:
+            # 并发创建时由唯一索引兜底
+            return {'success': False, 'message': '该密码已被使用，请更换密码'}
 
         return {'success': True, 'space_id': space_id, 'password_hash': password_hash}
 
     def enter_space(self, password):
         """通过密码进入空间"""
-        # 查询所有未删除的空间
-        spaces = db.query(
-            "SELECT * FROM spaces WHERE is_deleted = 0 AND expires_at > ?",
-            (datetime.now(),)
+        space = self._find_space_by_password(password, password_fingerprint(password))
+        if not space:
+            return {'success': False, 'message': '密码错误或空间不存在'}
+
+        # 更新最后访问时间
+        db.execute(
+            "UPDATE spaces SET last_accessed_at = ? WHERE id = ?",
+            (datetime.now(), space['id'])
+        )
+        return {'success': True, 'space': public_space(space), 'password_hash': space['password_hash']}
+
+    def _find_space_by_password(self, password, fingerprint, include_expired=False):
+        """根据密码查找未删除的空间
+
+        先按密码指纹走索引查找；未命中时再校验尚未写入指纹的旧空间，
+        匹配成功后补写指纹，旧数据随访问逐步迁移。
+        """
+        expires_filter = "" if include_expired else " AND expires_at > ?"
+        expires_params = () if include_expired else (datetime.now(),)
+
+        space = db.query_one(
+            "SELECT * FROM spaces WHERE password_fingerprint = ? AND is_deleted = 0" + expires_filter,
+            (fingerprint,) + expires_params
         )
+        if space:
+            return space if verify_password(password, space['password_hash']) else None
 
-        # 验证密码
-        for space in spaces:
+        legacy_spaces = db.query(
+            "SELECT * FROM spaces WHERE password_fingerprint IS NULL AND is_deleted = 0" + expires_filter,
+            expires_params
+        )
+        for space in legacy_spaces:
             if verify_password(password, space['password_hash']):
-                # 更新最后访问时间
                 db.execute(
-                    "UPDATE spaces SET last_accessed_at = ? WHERE id = ?",
-                    (datetime.now(), space['id'])
+                    "UPDATE spaces SET password_fingerprint = ? WHERE id = ?",
+                    (fingerprint, space['id'])
                 )
-                return {'success': True, 'space': space}
+                space['password_fingerprint'] = fingerprint
+                return space
 
-        return {'success': False, 'message': '密码错误或空间不存在'}
+        return None
 
     def get_spaces_by_token(self, token):
         """获取用户访问过的空间列表"""
         spaces = db.query("""
-            SELECT DISTINCT s.* FROM spaces s
+            SELECT s.id, s.name, s.created_at, s.expires_at, s.used_bytes, s.file_count FROM spaces s
             INNER JOIN space_access sa ON s.id = sa.space_id
             WHERE sa.token = ? AND s.is_deleted = 0 AND s.expires_at > ?
             ORDER BY sa.accessed_at DESC
-        """, (token, datetime.now()))
+            LIMIT ?
+        """, (token, datetime.now(), config.SPACE_ACCESS_HISTORY_LIMIT))
 
         return spaces
 
     def record_space_access(self, token, space_id):
-        """记录空间访问"""
-        db.execute(
-            "INSERT INTO space_access (token, space_id) VALUES (?, ?)",
-            (token, space_id)
-        )
+        """记录空间访问（每个令牌每个空间只保留一条记录）
+
+        访问记录同时是令牌访问该空间的授权，不按数量截断（否则进入新空间会使最早的空间失去授权），
+        只移除空间已删除或已过期的记录；空间列表只显示最近访问的若干个（见get_spaces_by_token）。
+        令牌过期后记录由清理任务删除。
+        """
+        with db.transaction() as conn:
+            # 时间精确到毫秒，同一秒内的多次访问也能区分先后
+            conn.execute(
+                """INSERT INTO space_access (token, space_id, accessed_at)
+                   VALUES (?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+                   ON CONFLICT (token, space_id) DO UPDATE SET accessed_at = excluded.accessed_at""",
+                (token, space_id)
+            )
+            # 移除该令牌对已失效空间的记录
+            conn.execute(
+                """DELETE FROM space_access WHERE token = ? AND NOT EXISTS (
+                       SELECT 1 FROM spaces s
+                       WHERE s.id = space_access.space_id AND s.is_deleted = 0 AND s.expires_at > ?
+                   )""",
+                (token, datetime.now())
+            )
 
     def delete_space(self, space_id):
         """删除空间"""
-        # 标记空间为已删除
-        db.execute(
-            "UPDATE spaces SET is_deleted = 1 WHERE id = ?",
-            (space_id,)
-        )
-
-        # 标记空间内所有文件为已删除
-        db.execute(
-            "UPDATE files SET is_deleted = 1 WHERE space_id = ?",
-            (space_id,)
-        )
+        with db.transaction() as conn:
+            # 标记空间为已删除
+            conn.execute(
+                "UPDATE spaces SET is_deleted = 1, deleted_at = ? WHERE id = ?",
+                (datetime.now(), space_id)
+            )
+
+            # 标记空间内所有文件为已删除，并释放物理文件
+            files = conn.execute(
+                "SELECT id, space_id, file_size, file_path, content_hash FROM files WHERE space_id = ? AND is_deleted = 0",
+                (space_id,)
+            ).fetchall()
+            conn.execute(
+                "UPDATE files SET is_deleted = 1, deleted_at = ? WHERE space_id = ? AND is_deleted = 0",
+                (datetime.now(), space_id)
+            )
+            paths, content_hashes = blob_service.release_files(conn, files)
+            quota_service.release(conn, files)
+        blob_service.delete_released(paths, content_hashes)
+
+        event_service.publish(space_id, 'space_deleted', {'id': space_id})
 
         return {'success': True}
 
@@ -99,11 +166,9 @@ class SpaceService:
         )
         return space
 
-    def extend_space_expiry(self, space_id, hours=24):
-        """延长空间过期时间"""
-        space = self.get_space_by_id(space_id)
-        if not space:
-            return {'success': False, 'message': '空间不存在'}
+    def extend_space_expiry(self, space, hours=24):
+        """延长空间过期时间（space为已查询的空间记录）"""
+        space_id = space['id']
 
         # 计算新的过期时间
         current_expires = datetime.fromisoformat(space['expires_at']) if isinstance(space['expires_at'], str) else space['expires_at']
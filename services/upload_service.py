@@ -0,0 +1,182 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+import config
+from database.db_manager import db
+from services.file_service import FileService
+from services.quota_service import quota_service
+from utils.validators import validate_filename, sanitize_filename
+from utils.file_handler import (generate_stored_filename, get_upload_path, delete_physical_file,
+                                write_stream_at, hash_file)
+
+
+class UploadService:
+    """分片上传服务
+
+    初始化时按文件总大小预分配一个分片文件，每个分片直接写入其偏移位置，
+    因此分片可以并行、乱序、重复上传；全部到齐后将分片文件重命名到上传目录，
+    不需要合并复制，随后与普通上传一样按内容哈希归入去重存储。
+    """
+
+    def __init__(self):
+        self.file_service = FileService()
+
+    def create_session(self, space_id, filename, file_size, chunk_size=None):
+        """创建上传会话"""
+        if not validate_filename(filename):
+            return {'success': False, 'message': '文件名不合法'}
+
+        if not isinstance(file_size, int) or file_size <= 0:
+            return {'success': False, 'message': '文件大小不合法'}
+
+        if file_size > config.MAX_RESUMABLE_FILE_SIZE:
+            return {'success': False, 'message': '文件大小超过上限'}
+
+        # 单个分片受请求体大小限制
+        chunk_size = chunk_size if isinstance(chunk_size, int) else config.UPLOAD_PART_SIZE
+        chunk_size = max(config.MIN_UPLOAD_PART_SIZE, min(chunk_size, config.MAX_FILE_SIZE))
+        total_chunks = (file_size + chunk_size - 1) // chunk_size
+
+        # 预分配分片文件（稀疏文件，不实际占用空间）
+        upload_id = str(uuid.uuid4())
+        os.makedirs(config.UPLOAD_PARTS_FOLDER, exist_ok=True)
+        part_path = os.path.join(config.UPLOAD_PARTS_FOLDER, upload_id + '.part')
+        with open(part_path, 'wb') as f:
+            f.truncate(file_size)
+
+        # 会话数和配额（含其他未完成会话声明的大小）的检查与写入会话记录在同一事务中，并发创建时不会同时通过
+        expires_at = datetime.now() + timedelta(hours=config.UPLOAD_SESSION_EXPIRES_HOURS)
+        with db.transaction() as conn:
+            open_sessions = conn.execute(
+                "SELECT COUNT(*) FROM upload_sessions WHERE space_id = ?",
+                (space_id,)
+            ).fetchone()[0]
+            if open_sessions >= config.UPLOAD_MAX_SESSIONS_PER_SPACE:
+                error = {'success': False, 'error': 'limit', 'message': '未完成的上传过多，请先完成或取消其他上传'}
+            else:
+                message = quota_service.check(space_id, file_size, conn)
+                error = {'success': False, 'error': 'quota', 'message': message} if message else None
+
+            if error is None:
+                conn.execute(
+                    """INSERT INTO upload_sessions (id, space_id, filename, file_size, chunk_size,
+                                                    total_chunks, part_path, expires_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (upload_id, space_id, filename, file_size, chunk_size, total_chunks, part_path, expires_at)
+                )
+
+        if error:
+            delete_physical_file(part_path)
+            return error
+
+        return {
+            'success': True,
+            'upload_id': upload_id,
+            'chunk_size': chunk_size,
+            'total_chunks': total_chunks
+        }
+
+    def get_session(self, space_id, upload_id):
+        """获取上传会话"""
+        return db.query_one(
+            "SELECT * FROM upload_sessions WHERE id = ? AND space_id = ? AND expires_at > ?",
+            (upload_id, space_id, datetime.now())
+        )
+
+    def get_status(self, space_id, upload_id):
+        """获取上传进度（用于断点续传）"""
+        session = self.get_session(space_id, upload_id)
+        if not session:
+            return {'success': False, 'message': '上传会话不存在'}
+
+        received = db.query(
+            "SELECT chunk_index FROM upload_chunks WHERE session_id = ? ORDER BY chunk_index",
+            (upload_id,)
+        )
+        return {
+            'success': True,
+            'upload_id': upload_id,
+            'chunk_size': session['chunk_size'],
+            'total_chunks': session['total_chunks'],
+            'received_chunks': [row['chunk_index'] for row in received]
+        }
+
+    def upload_chunk(self, space_id, upload_id, chunk_index, stream):
+        """上传单个分片，写入分片文件的对应位置"""
+        session = self.get_session(space_id, upload_id)
+        if not session:
+            return {'success': False, 'message': '上传会话不存在'}
+
+        if chunk_index < 0 or chunk_index >= session['total_chunks']:
+            return {'success': False, 'message': '分片序号不合法'}
+
+        offset = chunk_index * session['chunk_size']
+        length = min(session['chunk_size'], session['file_size'] - offset)
+
+        try:
+            if not write_stream_at(stream, session['part_path'], offset, length):
+                return {'success': False, 'message': '分片大小不正确'}
+        except FileNotFoundError:
+            # 会话已完成或已取消
+            return {'success': False, 'message': '上传会话不存在'}
+
+        db.execute(
+            "INSERT OR IGNORE INTO upload_chunks (session_id, chunk_index) VALUES (?, ?)",
+            (upload_id, chunk_index)
+        )
+        return {'success': True}
+
+    def complete(self, space_id, upload_id):
+        """完成上传：校验分片齐全后将分片文件移动到上传目录并写入文件记录"""
+        session = self.get_session(space_id, upload_id)
+        if not session:
+            return {'success': False, 'message': '上传会话不存在'}
+
+        received = db.query_one(
+            "SELECT COUNT(*) AS count FROM upload_chunks WHERE session_id = ?",
+            (upload_id,)
+        )
+        if received['count'] < session['total_chunks']:
+            return {'success': False, 'message': '分片未上传完整'}
+
+        original_filename = sanitize_filename(session['filename'])
+        stored_filename = generate_stored_filename(original_filename)
+
+        # 先将分片文件移出会话目录，防止并发的完成请求重复处理
+        temp_path = get_upload_path(stored_filename)
+        try:
+            os.replace(session['part_path'], temp_path)
+        except FileNotFoundError:
+            return {'success': False, 'message': '上传会话不存在'}
+        self._delete_session_rows(upload_id)
+
+        content_hash, head = hash_file(temp_path)
+
+        return self.file_service.save_file_record(space_id, original_filename, stored_filename, temp_path,
+                                                  session['file_size'], content_hash, head)
+
+    def abort(self, space_id, upload_id):
+        """取消上传"""
+        session = self.get_session(space_id, upload_id)
+        if not session:
+            return {'success': False, 'message': '上传会话不存在'}
+
+        delete_physical_file(session['part_path'])
+        self._delete_session_rows(upload_id)
+        return {'success': True}
+
+    def cleanup_expired_sessions(self):
+        """清理过期的上传会话，返回清理数量（清理后不再计入配额和会话数）"""
+        expired = db.query(
+            "SELECT id, part_path FROM upload_sessions WHERE expires_at < ?",
+            (datetime.now(),)
+        )
+        for session in expired:
+            delete_physical_file(session['part_path'])
+            self._delete_session_rows(session['id'])
+        return len(expired)
+
+    def _delete_session_rows(self, upload_id):
+        """删除会话及其分片记录"""
+        db.execute("DELETE FROM upload_chunks WHERE session_id = ?", (upload_id,))
+        db.execute("DELETE FROM upload_sessions WHERE id = ?", (upload_id,))
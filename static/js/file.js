@@ -4,18 +4,37 @@
 
 let currentSpaceId = SPACE_ID;
 let currentFileId = null;
+let fileItems = [];
+// 文件列表分页游标：next为下一页更早文件的位置，latest为已加载的最新文件的位置（用于增量刷新）
+let fileNextCursor = null;
+let fileLatestCursor = null;
+let selectedFileIds = new Set();
+// 正在查看的文本及其版本号（编辑保存时只提交改动部分）
+let currentText = null;
+let currentTextVersion = null;
+let eventSource = null;
+// 后台处理未完成时刷新预览的最多次数（间隔逐渐增加到10秒，处理完成后也会通过updated事件刷新）
+const PROCESSING_POLL_LIMIT = 20;
+// 搜索状态：有搜索词时文件列表显示搜索结果
+let searchQuery = '';
+let searchResults = [];
+let searchNextOffset = null;
+let searchTimer = null;
 
 document.addEventListener('DOMContentLoaded', function() {
     loadSpaceInfo();
+    // 先订阅变更事件再加载列表，避免遗漏两者之间的变更
+    connectSpaceEvents();
     loadFileList();
     setupFileUpload();
+    setupSearch();
     loadSidebarSpaces();
 });
 
 // 加载空间信息
 async function loadSpaceInfo() {
     try {
-        const response = await fetch(`/api/spaces/${currentSpaceId}/files`);
+        const response = await fetch(`/api/spaces/${currentSpaceId}/files?limit=1`);
         const data = await response.json();
 
         if (data.success && data.space) {
@@ -25,6 +44,14 @@ async function loadSpaceInfo() {
             if (spaceExpiresEl) {
                 spaceExpiresEl.textContent = formatTimeRemaining(data.space.expires_at);
             }
+            // 显示存储用量
+            const usage = data.usage;
+            const spaceUsageEl = document.getElementById('spaceUsage');
+            if (spaceUsageEl && usage) {
+                spaceUsageEl.textContent = usage.quota_bytes
+                    ? `${formatFileSize(usage.used_bytes)} / ${formatFileSize(usage.quota_bytes)}`
+                    : formatFileSize(usage.used_bytes);
+            }
         }
     } catch (error) {
         console.error('加载空间信息失败:', error);
@@ -56,26 +83,193 @@ async function loadSidebarSpaces() {
     }
 }
 
-// 加载文件列表
+// 加载文件列表第一页（列表只包含预览，更早的文件点击“加载更多”后加载）
 async function loadFileList() {
     try {
         const response = await fetch(`/api/spaces/${currentSpaceId}/files`);
         const data = await response.json();
+        if (!data.success) return;
 
-        if (data.success) {
-            displayFileList(data.files);
+        fileItems = data.files;
+        fileNextCursor = data.next_cursor;
+        fileLatestCursor = data.latest_cursor;
+        displayFileList(fileItems);
+    } catch (error) {
+        console.error('加载文件列表失败:', error);
+    }
+}
+
+// 加载下一页更早的文件，追加到列表末尾
+async function loadMoreFiles() {
+    if (!fileNextCursor) return;
+    try {
+        const cursor = fileNextCursor;
+        const response = await fetch(`/api/spaces/${currentSpaceId}/files?cursor=${encodeURIComponent(cursor)}`);
+        const data = await response.json();
+        // 等待期间列表已重新加载时丢弃结果
+        if (!data.success || cursor !== fileNextCursor) return;
+
+        const fileIds = new Set(fileItems.map(item => item.id));
+        fileItems = fileItems.concat(data.files.filter(file => !fileIds.has(file.id)));
+        fileNextCursor = data.next_cursor;
+        displayFileList(fileItems);
+    } catch (error) {
+        console.error('加载文件列表失败:', error);
+    }
+}
+
+// 只加载上次加载之后新增的文件，插入到列表开头
+async function loadNewFiles() {
+    if (!fileLatestCursor) {
+        loadFileList();
+        return;
+    }
+    try {
+        let hasMore = true;
+        while (hasMore) {
+            const response = await fetch(`/api/spaces/${currentSpaceId}/files?since=${encodeURIComponent(fileLatestCursor)}`);
+            const data = await response.json();
+            if (!data.success) return;
+
+            // 新增的文件按创建时间正序返回
+            const fileIds = new Set(fileItems.map(item => item.id));
+            const files = data.files.filter(file => !fileIds.has(file.id)).reverse();
+            fileItems = files.concat(fileItems);
+            fileLatestCursor = data.latest_cursor;
+            // 增量刷新时沿latest_cursor继续获取（next_cursor只用于加载更早的文件）
+            hasMore = data.has_more;
         }
+        displayFileList(fileItems);
     } catch (error) {
         console.error('加载文件列表失败:', error);
     }
 }
 
-// 显示文件列表
+// 订阅空间变更事件，其他设备上的改动实时同步到列表
+function connectSpaceEvents() {
+    if (!window.EventSource) return;
+
+    eventSource = new EventSource(`/api/spaces/${currentSpaceId}/events`);
+
+    eventSource.addEventListener('created', function(e) {
+        const file = JSON.parse(e.data);
+        if (!fileItems.some(item => item.id === file.id)) {
+            fileItems.unshift(file);
+            displayFileList(fileItems);
+        }
+    });
+
+    const mergeFile = function(e) {
+        const changes = JSON.parse(e.data);
+        const result = searchResults.find(item => item.id === changes.id);
+        if (result) {
+            Object.assign(result, changes);
+        }
+        const file = fileItems.find(item => item.id === changes.id);
+        if (file) {
+            Object.assign(file, changes);
+            displayFileList(fileItems);
+        }
+        // 正在查看的文本被修改时刷新预览（编辑中不刷新）
+        if (e.type === 'updated' && currentFileId === changes.id && !document.getElementById('editTextarea')) {
+            selectFile(changes.id);
+        }
+    };
+    eventSource.addEventListener('updated', mergeFile);
+    eventSource.addEventListener('extended', mergeFile);
+
+    eventSource.addEventListener('deleted', function(e) {
+        const fileId = JSON.parse(e.data).id;
+        fileItems = fileItems.filter(item => item.id !== fileId);
+        searchResults = searchResults.filter(item => item.id !== fileId);
+        displayFileList(fileItems);
+        if (currentFileId === fileId) {
+            currentFileId = null;
+            document.getElementById('previewArea').innerHTML = '<p class="preview-placeholder">选择一个项目进行预览</p>';
+        }
+    });
+
+    // 断线期间错过的事件无法补发，重新加载列表
+    eventSource.addEventListener('reset', function() {
+        loadFileList();
+    });
+
+    eventSource.addEventListener('space_deleted', function() {
+        eventSource.close();
+        eventSource = null;
+        showError('空间已被删除');
+    });
+}
+
+// 操作完成后刷新列表（事件流已连接时由事件更新，无需重新请求）
+// 新增文件后只加载新增部分；修改或删除了已有文件时（reload为true）重新加载第一页
+function refreshFileList(reload = false) {
+    if (!eventSource || eventSource.readyState !== EventSource.OPEN) {
+        if (reload) {
+            loadFileList();
+        } else {
+            loadNewFiles();
+        }
+    }
+}
+
+// 输入搜索词后稍等再搜索，清空时恢复文件列表
+function setupSearch() {
+    const searchInput = document.getElementById('searchInput');
+    searchInput.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => searchFiles(searchInput.value.trim()), 300);
+    });
+}
+
+// 搜索空间内的文件（offset不为空时加载下一页）
+async function searchFiles(query, offset = null) {
+    searchQuery = query;
+    if (!query) {
+        searchResults = [];
+        searchNextOffset = null;
+        displayFileList(fileItems);
+        return;
+    }
+
+    try {
+        const params = new URLSearchParams({ q: query });
+        if (offset !== null) params.set('offset', offset);
+        const response = await fetch(`/api/spaces/${currentSpaceId}/search?${params}`);
+        const data = await response.json();
+        // 等待期间搜索词已改变时丢弃结果
+        if (query !== searchQuery) return;
+        if (!data.success) {
+            showError(data.message);
+            return;
+        }
+
+        searchResults = offset !== null ? searchResults.concat(data.results) : data.results;
+        searchNextOffset = data.next_offset;
+        displayFileList(fileItems);
+    } catch (error) {
+        console.error('搜索失败:', error);
+    }
+}
+
+// 显示文件列表（搜索时显示搜索结果）
 function displayFileList(files) {
     const fileList = document.getElementById('fileList');
+    const searching = searchQuery !== '';
+
+    // 已删除的文件移出选择
+    const fileIds = new Set(files.map(file => file.id));
+    selectedFileIds.forEach(id => {
+        if (!fileIds.has(id)) selectedFileIds.delete(id);
+    });
+    updateBatchActions();
+
+    if (searching) {
+        files = searchResults;
+    }
 
     if (files.length === 0) {
-        fileList.innerHTML = '<p class="empty-message">暂无内容</p>';
+        fileList.innerHTML = `<p class="empty-message">${searching ? '没有找到匹配的内容' : '暂无内容'}</p>`;
         return;
     }
 
@@ -87,8 +281,16 @@ function displayFileList(files) {
             icon = '🖼️';
         }
 
+        // 搜索结果的文件名和摘要已由服务端转义，匹配部分用<mark>标出
         let preview = '';
-        if (file.file_type === 'text' && file.preview_text) {
+        if (searching) {
+            if (file.filename_highlight) {
+                preview += `<p class="file-name">${file.filename_highlight}</p>`;
+            }
+            if (file.snippet) {
+                preview += `<p class="file-preview">${file.snippet}</p>`;
+            }
+        } else if (file.file_type === 'text' && file.preview_text) {
             preview = `<p class="file-preview">${escapeHtml(file.preview_text)}</p>`;
         } else if (file.filename) {
             preview = `<p class="file-name">${escapeHtml(file.filename)}</p>`;
@@ -97,6 +299,8 @@ function displayFileList(files) {
         return `
             <div class="file-item ${currentFileId === file.id ? 'active' : ''}"
                  onclick="selectFile(${file.id})">
+                <input type="checkbox" class="file-check" ${selectedFileIds.has(file.id) ? 'checked' : ''}
+                       onclick="event.stopPropagation(); toggleFileSelection(${file.id}, this.checked)">
                 <span class="file-icon">${icon}</span>
                 <div class="file-info">
                     ${preview}
@@ -109,11 +313,38 @@ function displayFileList(files) {
                 </div>
             </div>
         `;
-    }).join('');
+    }).join('') + (searching
+        ? (searchNextOffset !== null
+            ? `<button class="clay-btn-secondary" onclick="searchFiles(searchQuery, ${searchNextOffset})">加载更多</button>`
+            : '')
+        : (fileNextCursor
+            ? '<button class="clay-btn-secondary" onclick="loadMoreFiles()">加载更多</button>'
+            : ''));
+}
+
+// 勾选或取消勾选文件（用于批量操作）
+function toggleFileSelection(fileId, checked) {
+    if (checked) {
+        selectedFileIds.add(fileId);
+    } else {
+        selectedFileIds.delete(fileId);
+    }
+    updateBatchActions();
+}
+
+// 更新批量操作按钮状态
+function updateBatchActions() {
+    const count = selectedFileIds.size;
+    const label = document.getElementById('downloadSelectedLabel');
+    if (!label) return;
+
+    label.textContent = count ? `打包下载所选（${count}）` : '打包下载全部';
+    document.getElementById('batchExtendBtn').disabled = count === 0;
+    document.getElementById('batchDeleteBtn').disabled = count === 0;
 }
 
-// 选择文件
-async function selectFile(fileId) {
+// 选择文件（pollCount为后台处理未完成时已刷新的次数）
+async function selectFile(fileId, pollCount = 0) {
     currentFileId = fileId;
 
     try {
@@ -122,7 +353,15 @@ async function selectFile(fileId) {
 
         if (data.success) {
             displayFilePreview(data.file);
-            loadFileList(); // 重新加载列表以更新选中状态
+            displayFileList(fileItems); // 更新选中状态
+
+            // 后台处理尚未完成时稍后刷新预览
+            const status = data.file.processing_status;
+            if ((status === 'pending' || status === 'processing') && pollCount < PROCESSING_POLL_LIMIT) {
+                setTimeout(() => {
+                    if (currentFileId === fileId) selectFile(fileId, pollCount + 1);
+                }, Math.min(1000 * (pollCount + 1), 10000));
+            }
         }
     } catch (error) {
         console.error('加载文件失败:', error);
@@ -134,6 +373,8 @@ function displayFilePreview(file) {
     const previewArea = document.getElementById('previewArea');
 
     if (file.file_type === 'text') {
+        currentText = file.content;
+        currentTextVersion = file.version;
         previewArea.innerHTML = `
             <div class="text-preview">
                 <div class="preview-actions-top">
@@ -146,7 +387,7 @@ function displayFilePreview(file) {
     } else if (file.file_type === 'image') {
         previewArea.innerHTML = `
             <div class="image-preview">
-                <img src="/api/files/${file.id}/content" alt="${escapeHtml(file.filename || '图片')}">
+                <img src="/api/files/${file.id}/content?size=medium" alt="${escapeHtml(file.filename || '图片')}">
                 <div class="preview-actions">
                     <button class="clay-btn-primary" onclick="downloadFile(${file.id})">下载</button>
                 </div>
@@ -248,7 +489,7 @@ async function submitTextContent(text) {
 
         if (data.success) {
             showSuccess('文本已提交');
-            loadFileList();
+            refreshFileList();
         } else {
             showError(data.message || '提交失败');
         }
@@ -260,25 +501,89 @@ async function submitTextContent(text) {
 
 // 上传文件
 async function uploadFile(file) {
+    // 大文件使用分片上传
     if (file.size > 20 * 1024 * 1024) {
-        showError('文件大小超过20MB限制');
+        await uploadLargeFile(file);
         return;
     }
 
-    const formData = new FormData();
-    formData.append('file', file);
-
     try {
-        const response = await fetch(`/api/spaces/${currentSpaceId}/files`, {
+        // 流式上传：请求体直接是文件内容
+        const filename = encodeURIComponent(file.name || 'file');
+        const response = await fetch(`/api/spaces/${currentSpaceId}/files/stream?filename=${filename}`, {
             method: 'POST',
-            body: formData
+            headers: {
+                'Content-Type': 'application/octet-stream'
+            },
+            body: file
         });
 
         const data = await response.json();
 
         if (data.success) {
             showSuccess('文件上传成功');
-            loadFileList();
+            refreshFileList();
+        } else {
+            showError(data.message || '上传失败');
+        }
+    } catch (error) {
+        console.error('上传文件失败:', error);
+        showError('上传失败，请重试');
+    }
+}
+
+// 分片上传大文件（分片并行上传，失败的分片可重试）
+async function uploadLargeFile(file) {
+    const baseUrl = `/api/spaces/${currentSpaceId}/uploads`;
+
+    try {
+        const initResponse = await fetch(baseUrl, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ filename: file.name, file_size: file.size })
+        });
+        const session = await initResponse.json();
+        if (!session.success) {
+            showError(session.message || '上传失败');
+            return;
+        }
+
+        const uploadUrl = `${baseUrl}/${session.upload_id}`;
+        let nextChunk = 0;
+
+        // 上传单个分片，失败最多重试3次
+        const uploadChunk = async (index) => {
+            const start = index * session.chunk_size;
+            const blob = file.slice(start, start + session.chunk_size);
+            for (let attempt = 0; attempt < 3; attempt++) {
+                const response = await fetch(`${uploadUrl}/chunks/${index}`, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream'
+                    },
+                    body: blob
+                });
+                if (response.ok) return;
+            }
+            throw new Error(`分片 ${index} 上传失败`);
+        };
+
+        // 3个并发上传
+        const worker = async () => {
+            while (nextChunk < session.total_chunks) {
+                await uploadChunk(nextChunk++);
+            }
+        };
+        await Promise.all([worker(), worker(), worker()]);
+
+        const completeResponse = await fetch(`${uploadUrl}/complete`, { method: 'POST' });
+        const data = await completeResponse.json();
+
+        if (data.success) {
+            showSuccess('文件上传成功');
+            refreshFileList();
         } else {
             showError(data.message || '上传失败');
         }
@@ -305,7 +610,6 @@ function editText() {
     const textContent = document.getElementById('textContent');
     if (!textContent || !currentFileId) return;
 
-    const currentText = textContent.textContent;
     const previewArea = document.getElementById('previewArea');
 
     previewArea.innerHTML = `
@@ -325,14 +629,19 @@ async function saveText() {
     if (!editTextarea || !currentFileId) return;
 
     const newText = editTextarea.value;
+    if (newText === currentText) {
+        selectFile(currentFileId);
+        return;
+    }
 
     try {
+        // 只提交改动的部分，基于打开编辑时的版本
         const response = await fetch(`/api/files/${currentFileId}`, {
-            method: 'PUT',
+            method: 'PATCH',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ content: newText })
+            body: JSON.stringify({ base_version: currentTextVersion, ops: [diffText(currentText, newText)] })
         });
 
         const data = await response.json();
@@ -340,7 +649,14 @@ async function saveText() {
         if (data.success) {
             showSuccess('保存成功');
             selectFile(currentFileId);
-            loadFileList();
+            refreshFileList(true);
+        } else if (response.status === 409) {
+            // 其他人已修改：确认后以最新版本为基础覆盖，否则保留编辑框以便复制修改
+            if (confirm('内容已被其他人修改，是否用你的版本覆盖？')) {
+                await overwriteText(newText, data.version);
+            } else {
+                showError(data.message);
+            }
         } else {
             showError(data.message || '保存失败');
         }
@@ -350,6 +666,48 @@ async function saveText() {
     }
 }
 
+// 计算两段文本之间的单个修改（去掉相同的开头和结尾）
+function diffText(oldText, newText) {
+    let start = 0;
+    const minLength = Math.min(oldText.length, newText.length);
+    while (start < minLength && oldText[start] === newText[start]) {
+        start++;
+    }
+
+    let end = 0;
+    while (end < minLength - start &&
+           oldText[oldText.length - 1 - end] === newText[newText.length - 1 - end]) {
+        end++;
+    }
+
+    return {
+        pos: start,
+        delete: oldText.length - start - end,
+        insert: newText.slice(start, newText.length - end)
+    };
+}
+
+// 以指定版本为基础提交完整内容
+async function overwriteText(text, baseVersion) {
+    const response = await fetch(`/api/files/${currentFileId}`, {
+        method: 'PUT',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ content: text, base_version: baseVersion })
+    });
+
+    const data = await response.json();
+
+    if (data.success) {
+        showSuccess('保存成功');
+        selectFile(currentFileId);
+        refreshFileList(true);
+    } else {
+        showError(data.message || '保存失败');
+    }
+}
+
 // 下载文件
 function downloadFile(fileId) {
     window.open(`/api/files/${fileId}/download`, '_blank');
@@ -374,7 +732,7 @@ async function deleteFile(fileId) {
                 currentFileId = null;
                 document.getElementById('previewArea').innerHTML = '<p class="preview-placeholder">选择一个项目进行预览</p>';
             }
-            loadFileList();
+            refreshFileList(true);
         } else {
             showError(data.message || '删除失败');
         }
@@ -399,7 +757,7 @@ async function extendFile(fileId) {
 
         if (data.success) {
             showSuccess('已延长24小时');
-            loadFileList();
+            refreshFileList(true);
         } else {
             showError(data.message || '延长失败');
         }
@@ -408,3 +766,78 @@ async function extendFile(fileId) {
         showError('延长失败，请重试');
     }
 }
+
+// 打包下载所选文件（未选择时下载全部）
+function downloadSelected() {
+    const ids = Array.from(selectedFileIds);
+    const query = ids.length ? `?ids=${ids.join(',')}` : '';
+    window.open(`/api/spaces/${currentSpaceId}/files/archive${query}`, '_blank');
+}
+
+// 批量删除所选文件
+async function deleteSelected() {
+    const ids = Array.from(selectedFileIds);
+    if (ids.length === 0 || !confirm(`确定要删除选中的${ids.length}个文件吗？`)) {
+        return;
+    }
+
+    try {
+        const response = await fetch(`/api/spaces/${currentSpaceId}/files/batch-delete`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ ids })
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            showSuccess(`已删除${data.deleted.length}个文件`);
+            selectedFileIds.clear();
+            if (ids.includes(currentFileId)) {
+                currentFileId = null;
+                document.getElementById('previewArea').innerHTML = '<p class="preview-placeholder">选择一个项目进行预览</p>';
+            }
+            refreshFileList(true);
+            updateBatchActions();
+        } else {
+            showError(data.message || '删除失败');
+        }
+    } catch (error) {
+        console.error('批量删除失败:', error);
+        showError('删除失败，请重试');
+    }
+}
+
+// 批量延长所选文件的过期时间
+async function extendSelected() {
+    const ids = Array.from(selectedFileIds);
+    if (ids.length === 0) return;
+
+    try {
+        const response = await fetch(`/api/spaces/${currentSpaceId}/files/batch-extend`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ ids, hours: 24 })
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            let message = `已将${data.extended.length}个文件延长24小时`;
+            if (data.skipped.length) {
+                message += `，${data.skipped.length}个已达到最大保留时间`;
+            }
+            showSuccess(message);
+            refreshFileList(true);
+        } else {
+            showError(data.message || '延长失败');
+        }
+    } catch (error) {
+        console.error('批量延长失败:', error);
+        showError('延长失败，请重试');
+    }
+}
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """带过期时间的LRU缓存（线程安全）
+
+    每次delete或clear使失效代数加一。从数据源读取前先取得代数（generation），
+    写入时传回：读取期间发生过删除时不写入，避免删除前读到的旧值在删除后被重新写入缓存。
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def get(self, key):
+        """获取缓存值，不存在或已过期返回None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self):
+        """当前失效代数，在从数据源读取之前获取"""
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, ttl=None, generation=None):
+        """写入缓存，ttl为空时使用默认过期时间（秒）
+
+        generation为读取数据源之前取得的失效代数，此后有过删除时放弃写入。
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """删除缓存"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._generation += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+
+    def stats(self):
+        """获取命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0
+            }
@@ -0,0 +1,96 @@
+"""
+文本内容的压缩存储与HTTP响应压缩
+
+较长的文本以gzip格式存入files.content，files.content_encoding记为'gzip'（为空表示未压缩的文本）。
+gzip格式可直接作为Content-Encoding: gzip的响应体发送，无需先解压再压缩。
+"""
+import gzip
+from flask import request
+import config
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只使用gzip
+    brotli = None
+
+# 可以压缩的响应类型（图片、压缩包等已压缩的格式不再压缩）
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'}
+
+
+def encode_text(content):
+    """按存储格式编码文本，返回(存储值, 编码)；较短或压缩效果不明显时原样存储"""
+    data = content.encode('utf-8')
+    if len(data) < config.TEXT_COMPRESS_MIN_BYTES:
+        return content, None
+
+    compressed = gzip.compress(data, compresslevel=config.COMPRESS_LEVEL, mtime=0)
+    if len(compressed) > len(data) * 0.9:
+        return content, None
+    return compressed, 'gzip'
+
+
+def decode_text(value, encoding):
+    """将存储值还原为文本"""
+    if value is None:
+        return None
+    if encoding == 'gzip':
+        return gzip.decompress(value).decode('utf-8')
+    return value
+
+
+def accepts_encoding(encoding):
+    """当前请求是否接受指定的Content-Encoding"""
+    return request.accept_encodings[encoding] > 0
+
+
+def choose_encoding():
+    """按客户端支持情况选择响应压缩格式（优先br），不支持时返回None"""
+    if brotli is not None and accepts_encoding('br'):
+        return 'br'
+    if accepts_encoding('gzip'):
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """压缩JSON和文本响应（after_request钩子）
+
+    只处理200响应；流式响应、已设置Content-Encoding的响应（如原样发送的gzip文本）保持不变。
+    直接发送的文件（send_file）不超过COMPRESS_MAX_BYTES时读入后压缩，更大的文件原样发送。
+    带ETag的响应压缩后改为弱ETag（压缩结果与原内容不是逐字节相同）。
+    """
+    response.vary.add('Accept-Encoding')
+
+    if (response.status_code != 200
+            or (response.is_streamed and not response.direct_passthrough)
+            or 'Content-Encoding' in response.headers
+            or request.method == 'HEAD'):
+        return response
+
+    mimetype = response.mimetype or ''
+    if not (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    length = response.content_length or 0
+    if length < config.COMPRESS_MIN_BYTES:
+        return response
+    if response.direct_passthrough and length > config.COMPRESS_MAX_BYTES:
+        return response
+
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    response.direct_passthrough = False
+    data = response.get_data()
+    if encoding == 'br':
+        data = brotli.compress(data, quality=config.BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=config.COMPRESS_LEVEL)
+
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
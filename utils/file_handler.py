@@ -1,8 +1,12 @@
 import os
 import uuid
+import codecs
+import hashlib
+import zipfile
 from datetime import datetime
-from PIL import Image
+from PIL import Image, ImageOps
 import config
+from utils.metrics import Timer, UPLOAD_BYTES, UPLOAD_DURATION, HASH_DURATION
 
 
 def generate_stored_filename(original_filename):
@@ -42,6 +46,150 @@ def read_text_file(file_path):
         return None
 
 
+def decode_text_head(data):
+    """解码文本开头部分（末尾可能截断了半个字符），用于生成预览"""
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            return codecs.getincrementaldecoder(encoding)().decode(data)
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def save_stream(stream, file_path, max_size):
+    """将数据流分块写入文件，同时计算大小和SHA256
+
+    超过大小限制时删除已写入的部分并返回None；
+    否则返回(大小, 哈希, 开头部分数据)，开头部分用于生成预览，避免写完后再读一遍。
+    """
+    hasher = hashlib.sha256()
+    file_size = 0
+    head = b''
+
+    try:
+        with Timer(UPLOAD_DURATION, 'stream'), open(file_path, 'wb') as f:
+            while True:
+                chunk = stream.read(config.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                file_size += len(chunk)
+                if file_size > max_size:
+                    break
+
+                hasher.update(chunk)
+                f.write(chunk)
+                if len(head) < config.PREVIEW_HEAD_BYTES:
+                    head += chunk[:config.PREVIEW_HEAD_BYTES - len(head)]
+    except Exception:
+        delete_physical_file(file_path)
+        raise
+
+    if file_size > max_size:
+        delete_physical_file(file_path)
+        return None
+
+    UPLOAD_BYTES.inc(file_size, 'stream')
+    return file_size, hasher.hexdigest(), head
+
+
+def write_stream_at(stream, file_path, offset, length):
+    """将数据流写入已有文件的指定位置，数据长度必须正好等于length"""
+    written = 0
+    with Timer(UPLOAD_DURATION, 'chunk'), open(file_path, 'r+b') as f:
+        f.seek(offset)
+        while written <= length:
+            chunk = stream.read(min(config.UPLOAD_CHUNK_SIZE, length + 1 - written))
+            if not chunk:
+                break
+            f.write(chunk[:max(length - written, 0)])
+            written += len(chunk)
+
+    if written != length:
+        return False
+    UPLOAD_BYTES.inc(written, 'chunk')
+    return True
+
+
+def hash_file(file_path):
+    """计算文件的SHA256，返回(哈希, 开头部分数据)"""
+    hasher = hashlib.sha256()
+    head = b''
+    with Timer(HASH_DURATION), open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(config.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            if len(head) < config.PREVIEW_HEAD_BYTES:
+                head += chunk[:config.PREVIEW_HEAD_BYTES - len(head)]
+
+    return hasher.hexdigest(), head
+
+
+class _ZipStream:
+    """只追加的输出缓冲，供zipfile写入不可定位的流（使用数据描述符，无需回写文件头）"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """取出已写入的数据"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries):
+    """边读边生成ZIP压缩包，逐块返回，不在磁盘或内存中暂存整个压缩包
+
+    entries为(包内文件名, 文件路径或返回bytes的函数, 修改时间datetime, 是否压缩)，
+    函数在写入该条目时才调用（同一时刻只有一个条目的内容在内存中），返回None或
+    文件读取时已被删除的条目直接跳过。
+    """
+    output = _ZipStream()
+    with zipfile.ZipFile(output, 'w') as archive:
+        for name, source, modified_at, compress in entries:
+            info = zipfile.ZipInfo(name, date_time=modified_at.timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+
+            if callable(source):
+                data = source()
+                if data is None:
+                    continue
+                archive.writestr(info, data)
+            else:
+                try:
+                    f = open(source, 'rb')
+                except FileNotFoundError:
+                    continue
+                with f:
+                    info.file_size = os.fstat(f.fileno()).st_size
+                    with archive.open(info, 'w', force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dest:
+                        while True:
+                            chunk = f.read(config.UPLOAD_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            dest.write(chunk)
+                            data = output.drain()
+                            if data:
+                                yield data
+
+            data = output.drain()
+            if data:
+                yield data
+
+    # 中央目录
+    yield output.drain()
+
+
 def delete_physical_file(file_path):
     """删除物理文件"""
     try:
@@ -53,6 +201,46 @@ def delete_physical_file(file_path):
     return False
 
 
+def get_thumbnail_path(file_path, size_name):
+    """获取缩略图路径（与原文件放在同一目录）"""
+    return f"{file_path}.{size_name}.webp"
+
+
+def get_thumbnail(file_path, size_name):
+    """获取图片缩略图，不存在时生成
+
+    返回缩略图路径；原图已经足够小或无法处理时返回None，由调用方直接使用原图。
+    """
+    thumb_path = get_thumbnail_path(file_path, size_name)
+    if os.path.exists(thumb_path):
+        return thumb_path
+
+    max_side = config.THUMBNAIL_SIZES[size_name]
+    try:
+        with Image.open(file_path) as image:
+            if image.width <= max_side and image.height <= max_side:
+                return None
+
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            image.thumbnail((max_side, max_side))
+
+            # 先写临时文件再重命名，避免并发请求读到写了一半的缩略图
+            temp_path = f"{thumb_path}.{uuid.uuid4().hex}.tmp"
+            image.save(temp_path, 'WEBP', quality=config.THUMBNAIL_QUALITY)
+            os.replace(temp_path, thumb_path)
+            return thumb_path
+    except Exception as e:
+        print(f"生成缩略图失败: {e}")
+        return None
+
+
+def get_thumbnail_paths(file_path):
+    """获取文件所有尺寸的缩略图路径"""
+    return [get_thumbnail_path(file_path, size_name) for size_name in config.THUMBNAIL_SIZES]
+
+
 def get_mime_type(filename):
     """根据文件扩展名获取MIME类型"""
     ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
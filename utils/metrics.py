@@ -0,0 +1,212 @@
+"""
+性能指标收集（Prometheus文本格式）
+
+指标保存在当前进程内，多进程部署时每个进程分别统计。
+"""
+import re
+import threading
+import time
+from functools import lru_cache
+import config
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names, values):
+    """格式化标签，如 {route="/api/files",status="200"}"""
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    """累加计数器"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    """分桶统计（耗时、数量等）"""
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # 标签值 -> [各分桶计数, 总和, 总数]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            item = self._values.get(label_values)
+            if item is None:
+                item = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    item[0][i] += 1
+                    break
+            item[1] += value
+            item[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        bucket_labels = self.labels + ('le',)
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(bucket_labels, label_values + (bound,))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(bucket_labels, label_values + ('+Inf',))
+                lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {total}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Gauge:
+    """当前值（渲染时调用函数获取）"""
+
+    def __init__(self, name, help_text, func):
+        self.name = name
+        self.help = help_text
+        self.func = func
+
+    def render(self):
+        try:
+            value = self.func()
+        except Exception:
+            return []
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge', f'{self.name} {value}']
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, func):
+        return self._register(Gauge(name, help_text, func))
+
+    def render(self):
+        """输出Prometheus文本格式"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+# 全局指标注册表
+registry = MetricsRegistry()
+
+REQUEST_DURATION = registry.histogram(
+    'sharezone_request_duration_seconds', '请求处理耗时', ('method', 'route', 'status'))
+REQUEST_DB_QUERIES = registry.histogram(
+    'sharezone_request_db_queries', '每个请求执行的SQL数', ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+REQUEST_DB_DURATION = registry.histogram(
+    'sharezone_request_db_duration_seconds', '每个请求的SQL总耗时', ('route',))
+DB_QUERY_DURATION = registry.histogram(
+    'sharezone_db_query_duration_seconds', 'SQL执行耗时（按语句形状）', ('query',))
+SLOW_QUERIES = registry.counter(
+    'sharezone_db_slow_queries_total', '超过慢查询阈值的SQL数', ('query',))
+UPLOAD_BYTES = registry.counter(
+    'sharezone_upload_bytes_total', '上传写入的字节数', ('kind',))
+UPLOAD_DURATION = registry.histogram(
+    'sharezone_upload_write_duration_seconds', '上传数据写入磁盘（含哈希计算）的耗时', ('kind',))
+HASH_DURATION = registry.histogram(
+    'sharezone_file_hash_duration_seconds', '分片上传完成后计算文件哈希的耗时')
+DOWNLOAD_BYTES = registry.counter(
+    'sharezone_download_bytes_total', '下载和预览响应的字节数', ('route',))
+CLEANUP_DURATION = registry.histogram(
+    'sharezone_cleanup_duration_seconds', '定时清理任务耗时', ('job',),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300))
+
+# 当前线程正在处理的请求的SQL统计（每个请求开始时重置）
+_request_stats = threading.local()
+
+
+def start_request():
+    """请求开始：重置当前线程的SQL统计"""
+    _request_stats.queries = 0
+    _request_stats.db_seconds = 0.0
+
+
+def finish_request():
+    """请求结束：返回(SQL数, SQL总耗时)"""
+    return getattr(_request_stats, 'queries', 0), getattr(_request_stats, 'db_seconds', 0.0)
+
+
+@lru_cache(maxsize=1024)
+def query_shape(sql):
+    """SQL语句形状：合并空白、IN列表和字面量，用作指标标签"""
+    shape = ' '.join(sql.split())
+    shape = re.sub(r"'(?:[^']|'')*'", '?', shape)
+    shape = re.sub(r'\b\d+\b', '?', shape)
+    shape = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?)', shape)
+    return shape[:200]
+
+
+def record_query(sql, seconds):
+    """记录一次SQL执行"""
+    shape = query_shape(sql)
+    DB_QUERY_DURATION.observe(seconds, shape)
+
+    if hasattr(_request_stats, 'queries'):
+        _request_stats.queries += 1
+        _request_stats.db_seconds += seconds
+
+    if config.SLOW_QUERY_MS is not None and seconds * 1000 >= config.SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(1, shape)
+        print(f"[数据库] 慢查询 {seconds * 1000:.1f}ms: {shape}")
+
+
+class Timer:
+    """计时上下文：with Timer(HISTOGRAM, 标签...): ..."""
+
+    def __init__(self, histogram, *label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+        return False
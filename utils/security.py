@@ -1,5 +1,7 @@
 import hashlib
+import hmac
 import secrets
+import config
 
 
 def hash_password(password):
@@ -16,3 +18,8 @@ def verify_password(password, hash_string):
         return pwd_hash == hashlib.sha256((password + salt).encode()).hexdigest()
     except:
         return False
+
+
+def password_fingerprint(password):
+    """生成密码指纹（以SECRET_KEY为密钥的HMAC，结果确定，可用于索引查找）"""
+    return hmac.new(config.SECRET_KEY.encode(), password.encode(), hashlib.sha256).hexdigest()
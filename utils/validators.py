@@ -45,3 +45,9 @@ def is_text_file(filename):
 def validate_file_size(file_size):
     """验证文件大小"""
     return file_size <= config.MAX_FILE_SIZE
+
+
+def validate_extend_hours(hours):
+    """验证延长时间（小时）：正整数且不超过最大保留天数"""
+    return (isinstance(hours, int) and not isinstance(hours, bool)
+            and 0 < hours <= config.MAX_EXTEND_DAYS * 24)